@@ -0,0 +1,87 @@
+# Dish GET latency through the real DishService read path, with the discounts read from the workbook on every
+# request (as before the discount index) and from the discount index. Every request misses the cache, so each one
+# fetches the dish and discounts its Decimal price; a cache hit is measured for reference.
+# Needs the Postgres and Redis of .env with the tables created (docker compose up db redis app); the benchmark dish
+# lives in a menu of its own that is deleted afterwards.
+# Run from the project root: python -m benchmarks.bench_discounts
+import asyncio
+import time
+import uuid
+from collections.abc import Callable
+from decimal import Decimal
+from unittest import mock
+
+import orjson
+from fastapi import BackgroundTasks
+from sqlalchemy import delete
+
+from src.main import redis
+from src.menu import service as service_module
+from src.menu.discounts import discount_index, parse_discounts
+from src.menu.local_cache import local_cache
+from src.menu.models import Dish, Menu, Submenu
+from src.menu.redis_utils import dish_key
+from src.menu.repository import DishRepository
+from src.menu.service import DishService
+from src.menu.sheets_parser import iter_rows
+from src.unit_of_work import UnitOfWork
+
+REQUESTS = 200
+DISCOUNT = '15'
+
+
+async def dish_get_ms(ids: tuple[uuid.UUID, uuid.UUID, uuid.UUID], miss: bool) -> float:
+    menu_id, submenu_id, dish_id = ids
+    timings = []
+
+    for _ in range(REQUESTS):
+        if miss:
+            await redis.unlink(dish_key(menu_id, submenu_id, dish_id))
+            local_cache.clear()
+
+        async with UnitOfWork() as uow:
+            service = DishService(DishRepository(uow.session), uow)
+            start = time.perf_counter()
+            body = await service.retrieve_one(dish_id,
+                                              redis=redis,
+                                              menu_id=menu_id,
+                                              submenu_id=submenu_id,
+                                              background_tasks=BackgroundTasks())
+            timings.append(time.perf_counter() - start)
+
+    assert orjson.loads(body)['price'] == '85.00'
+    return min(timings) * 1000
+
+
+async def main() -> None:
+    menu, submenu, dish = (Menu(title='Bench', description='Bench'),
+                           Submenu(title='Bench', description='Bench'),
+                           Dish(title='Bench', description='Bench', price=Decimal('100.00')))
+    submenu.menu, dish.submenu = menu, submenu
+
+    async with UnitOfWork() as uow:
+        uow.session.add_all([menu, submenu, dish])
+        await uow.commit()
+
+    ids = (menu.id, submenu.id, dish.id)
+    bench = {str(dish.id): DISCOUNT}
+
+    variants: tuple[tuple[str, Callable[[], dict[str, str]], bool], ...] = (
+        ('workbook parse', lambda: {**parse_discounts(iter_rows()), **bench}, True),
+        ('discount index', lambda: {**discount_index.get(), **bench}, True),
+        ('cache hit', lambda: {**discount_index.get(), **bench}, False),
+    )
+
+    try:
+        for name, get_discounts, miss in variants:
+            with mock.patch.object(service_module, 'get_discounts', get_discounts):
+                print(f'{name:>15}: {await dish_get_ms(ids, miss):8.2f} ms per dish GET')
+    finally:
+        async with UnitOfWork() as uow:
+            await uow.session.execute(delete(Menu).where(Menu.id == menu.id))
+            await uow.commit()
+        await redis.aclose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+# Compares requests per second of a cache hit on GET /menus before and after pre-serialized bodies:
+# decoding the cached page into pydantic models that FastAPI validates and serializes again, against sending
+# the cached bytes as they are. The Redis reply is held in memory, so only the work in the process is measured.
+# Run from the project root: python -m benchmarks.bench_responses
+import asyncio
+import json
+import time
+import uuid
+
+import orjson
+from fastapi import FastAPI, Response
+from httpx import ASGITransport, AsyncClient
+
+from src.menu.schemas import MenuRetrieve
+
+PAGE_SIZE = 100
+REQUESTS = 2000
+
+MENUS = [{'id': str(uuid.uuid4()),
+          'title': f'Menu {number}',
+          'description': f'Menu description {number}',
+          'submenus_count': 3,
+          'dishes_count': 12} for number in range(PAGE_SIZE)]
+
+CACHED_PAGE = json.dumps({'items': MENUS, 'next_cursor': None}).encode('utf-8')
+CACHED_BODY = orjson.dumps(MENUS)
+
+app = FastAPI()
+
+
+@app.get('/models', response_model=list[MenuRetrieve])
+async def get_models() -> list[MenuRetrieve]:
+    page = json.loads(CACHED_PAGE)
+    return [MenuRetrieve(**item) for item in page['items']]
+
+
+@app.get('/bytes', response_model=list[MenuRetrieve])
+async def get_bytes() -> Response:
+    return Response(content=CACHED_BODY, media_type='application/json')
+
+
+async def requests_per_second(client: AsyncClient, url: str) -> float:
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await client.get(url)
+    return REQUESTS / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://bench') as client:
+        assert (await client.get('/models')).json() == (await client.get('/bytes')).json()
+
+        for name, url in (('pydantic models', '/models'), ('raw bytes', '/bytes')):
+            best = max([await requests_per_second(client, url) for _ in range(3)])
+            print(f'{name:>15}: {best:10.0f} requests/s ({PAGE_SIZE} menus per page)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
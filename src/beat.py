@@ -4,8 +4,7 @@ from celery import Celery
 
 from .config import RABBITMQ_DEFAULT_PASS, RABBITMQ_DEFAULT_USER
 from .main import redis
-from .menu.sheets_parser import get_rows
-from .menu.tasks_utils import synchronize
+from .menu.tasks_utils import synchronize_if_changed
 
 RABBITMQ_DEFAULT_USER = RABBITMQ_DEFAULT_USER
 RABBITMQ_DEFAULT_PASS = RABBITMQ_DEFAULT_PASS
@@ -15,10 +14,9 @@ celery = Celery('sync_data',
 
 
 @celery.task
-def synchronize_from_doc() -> None:
-    values = get_rows()
+def synchronize_from_doc() -> dict[str, float]:
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(synchronize(values, redis))
+    return loop.run_until_complete(synchronize_if_changed(redis))
 
 
 celery.add_periodic_task(15.0, synchronize_from_doc.s(), name='sync every 15')
@@ -10,10 +10,60 @@ DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_NAME = os.getenv('DB_NAME')
 
+# Engine tuning, see src/database.py
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 20))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_POOL_SLOW_CHECKOUT_MS = float(os.getenv('DB_POOL_SLOW_CHECKOUT_MS', 100))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))
+DB_JIT = os.getenv('DB_JIT', 'off')
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false').lower() == 'true'
+
 DB_PORT_TEST = os.getenv('DB_PORT_TEST')
 DB_USER_TEST = os.getenv('DB_USER_TEST')
 DB_PASSWORD_TEST = os.getenv('DB_PASSWORD_TEST')
 DB_NAME_TEST = os.getenv('DB_NAME_TEST')
 
+REDIS_HOST = os.getenv('REDIS_HOST', 'redis')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = int(os.getenv('REDIS_POOL_TIMEOUT', 5))
+
+# Write created/updated entities into the cache instead of only invalidating it
+CACHE_WRITE_THROUGH = os.getenv('CACHE_WRITE_THROUGH', 'true').lower() == 'true'
+
+# Cache policy, see src/menu/cache_policy.py: seconds a cached entity or listing lives, the random fraction added
+# to spread expiries, whether a hit renews the TTL, and the memory budget set on Redis at startup (empty: leave the
+# server's own configuration alone)
+CACHE_TTL_MENU = int(os.getenv('CACHE_TTL_MENU', 3600))
+CACHE_TTL_SUBMENU = int(os.getenv('CACHE_TTL_SUBMENU', 3600))
+CACHE_TTL_DISH = int(os.getenv('CACHE_TTL_DISH', 3600))
+CACHE_TTL_LIST = int(os.getenv('CACHE_TTL_LIST', 600))
+CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', 0.1))
+CACHE_SLIDING_EXPIRY = os.getenv('CACHE_SLIDING_EXPIRY', 'false').lower() == 'true'
+CACHE_MAXMEMORY = os.getenv('CACHE_MAXMEMORY', '')
+CACHE_MAXMEMORY_POLICY = os.getenv('CACHE_MAXMEMORY_POLICY', 'allkeys-lfu')
+CACHE_TRACK_EVICTIONS = os.getenv('CACHE_TRACK_EVICTIONS', 'true').lower() == 'true'
+
+# In-process cache in front of Redis, see src/menu/local_cache.py: entries per worker (0 disables it) and seconds
+# an entry is trusted when an invalidation message is lost
+CACHE_LOCAL_MAXSIZE = int(os.getenv('CACHE_LOCAL_MAXSIZE', 10000))
+CACHE_LOCAL_TTL = float(os.getenv('CACHE_LOCAL_TTL', 10))
+
+# Single-flight of cache misses: how long one worker may hold a recomputation lock
+CACHE_LOCK_TIMEOUT_MS = int(os.getenv('CACHE_LOCK_TIMEOUT_MS', 3000))
+
+# Keyset pagination of menu, submenu and dish listings
+PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', 100))
+PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', 1000))
+
+# Largest number of creates, updates or deletes in one list of a :batch request
+BATCH_SIZE_MAX = int(os.getenv('BATCH_SIZE_MAX', 1000))
+
+# Rows fetched per round trip when /menus/dependencies is streamed
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 500))
+
 RABBITMQ_DEFAULT_USER = os.getenv('RABBITMQ_DEFAULT_USER')
 RABBITMQ_DEFAULT_PASS = os.getenv('RABBITMQ_DEFAULT_PASS')
@@ -1,14 +1,116 @@
+import logging
+import time
+from collections.abc import Callable
 from typing import AsyncGenerator
+from uuid import uuid4
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
 
-from src.config import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+from src.config import (
+    DB_HOST,
+    DB_JIT,
+    DB_MAX_OVERFLOW,
+    DB_NAME,
+    DB_PASSWORD,
+    DB_PGBOUNCER,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_SLOW_CHECKOUT_MS,
+    DB_POOL_TIMEOUT,
+    DB_PORT,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_USER,
+)
 
 DATABASE_URL = f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+
+    def __init__(self, slow_checkout_ms: float = DB_POOL_SLOW_CHECKOUT_MS):
+        self.slow_checkout_ms = slow_checkout_ms
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.hooks: list[Callable[[float], None]] = []
+
+    def add_hook(self, hook: Callable[[float], None]) -> None:
+        self.hooks.append(hook)
+
+    def observe_checkout(self, wait: float) -> None:
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+        if wait * 1000 >= self.slow_checkout_ms:
+            self.slow_checkouts += 1
+            logger.warning('Waited %.1f ms for a database connection, the pool may be exhausted', wait * 1000)
+
+        for hook in self.hooks:
+            hook(wait)
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            'checkouts': self.checkouts,
+            'slow_checkouts': self.slow_checkouts,
+            'avg_wait_ms': self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredAsyncAdaptedQueue(AsyncAdaptedQueue):
+    # Every checkout takes from the queue first, a new connection is only opened once it is empty: timing the queue
+    # alone leaves the connection setup out of the wait
+
+    def get(self, block: bool = True, timeout: float | None = None):
+        start = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            pool_metrics.observe_checkout(time.perf_counter() - start)
+
+
+class MeteredAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    _queue_class = MeteredAsyncAdaptedQueue
+
+
+def get_connect_args() -> dict:
+    connect_args: dict = {
+        'server_settings': {'jit': DB_JIT},
+        'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+        'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+    }
+
+    if DB_PGBOUNCER:
+        # Transaction pooling hands every transaction to a different server connection,
+        # so prepared statements must be neither cached nor reused by name
+        connect_args['statement_cache_size'] = 0
+        connect_args['prepared_statement_cache_size'] = 0
+        connect_args['prepared_statement_name_func'] = lambda: f'__asyncpg_{uuid4()}__'
+        # and PgBouncer rejects startup parameters it does not know: jit is then set on the database or role
+        connect_args['server_settings'] = {}
+
+    return connect_args
+
+
 engine = create_async_engine(
     url=DATABASE_URL,
-    pool_size=20,
+    poolclass=MeteredAsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=get_connect_args(),
     # echo=True,
 )
 
@@ -1,22 +1,53 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from typing import AsyncGenerator
 
 from fastapi import FastAPI
-from redis import Redis
-
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from .config import (
+    CACHE_TRACK_EVICTIONS,
+    REDIS_HOST,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_POOL_TIMEOUT,
+    REDIS_PORT,
+)
+from .menu.cache_policy import configure_cache, watch_evictions
+from .menu.local_cache import watch_invalidations
 from .menu.models import init_db
 from .menu.router import router as menu_router
+from .menu.router import stats_router
+from .menu.single_flight import single_flight
+
+# Each pub/sub watcher holds a connection for the life of the worker, on top of those shared by requests
+WATCHER_CONNECTIONS = 3 if CACHE_TRACK_EVICTIONS else 2
 
-redis = Redis(host='redis', port=6379, db=0)
+# Blocking: when every connection is busy a request waits for one instead of failing with "Too many connections"
+redis_pool = BlockingConnectionPool(host=REDIS_HOST,
+                                    port=REDIS_PORT,
+                                    db=0,
+                                    max_connections=REDIS_MAX_CONNECTIONS + WATCHER_CONNECTIONS,
+                                    timeout=REDIS_POOL_TIMEOUT)
+redis = Redis(connection_pool=redis_pool)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator:
     app.state.redis = redis
-    await init_db()
+    await init_db(redis)
+    await configure_cache(redis)
+    watchers = [asyncio.create_task(watch_invalidations(redis)),
+                asyncio.create_task(single_flight.watch_releases(redis))]
+    if CACHE_TRACK_EVICTIONS:
+        watchers.append(asyncio.create_task(watch_evictions(redis)))
     yield
-    redis.flushall()
-    redis.close()
+    for watcher in watchers:
+        watcher.cancel()
+        with suppress(asyncio.CancelledError):
+            await watcher
+    await redis.flushall()
+    await redis.aclose()
+    await redis_pool.disconnect()
 
 
 app = FastAPI(
@@ -25,3 +56,4 @@ app = FastAPI(
 )
 
 app.include_router(menu_router)
+app.include_router(stats_router)
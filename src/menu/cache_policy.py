@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import random
+import re
+from collections import Counter
+from collections.abc import Iterable
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+
+from src.config import (
+    CACHE_MAXMEMORY,
+    CACHE_MAXMEMORY_POLICY,
+    CACHE_SLIDING_EXPIRY,
+    CACHE_TRACK_EVICTIONS,
+    CACHE_TTL_DISH,
+    CACHE_TTL_JITTER,
+    CACHE_TTL_LIST,
+    CACHE_TTL_MENU,
+    CACHE_TTL_SUBMENU,
+)
+
+logger = logging.getLogger(__name__)
+
+MENU, SUBMENU, DISH = 'menu', 'submenu', 'dish'
+MENU_LIST, SUBMENU_LIST, DISH_LIST = 'menu_list', 'submenu_list', 'dish_list'
+TAG = 'tag'
+
+TTLS = {
+    MENU: CACHE_TTL_MENU,
+    SUBMENU: CACHE_TTL_SUBMENU,
+    DISH: CACHE_TTL_DISH,
+    MENU_LIST: CACHE_TTL_LIST,
+    SUBMENU_LIST: CACHE_TTL_LIST,
+    DISH_LIST: CACHE_TTL_LIST,
+}
+
+# Tag sets outlive every key they index, so an expired entry never leaves a live one untracked
+TAG_TTL = int(max(TTLS.values()) * (1 + CACHE_TTL_JITTER)) + 1
+
+_UUID = '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+
+# Shapes of the keys in src/menu/redis_utils.py
+KEY_TYPES = (
+    (re.compile(f'^{_UUID}::$'), MENU),
+    (re.compile(f'^{_UUID}:{_UUID}:$'), SUBMENU),
+    (re.compile(f'^{_UUID}:{_UUID}:{_UUID}$'), DISH),
+    (re.compile('^list:menu$'), MENU_LIST),
+    (re.compile(f'^list:submenu:{_UUID}$'), SUBMENU_LIST),
+    (re.compile(f'^list:dish:{_UUID}:{_UUID}$'), DISH_LIST),
+    (re.compile(f'^tag:{_UUID}(:{_UUID})?$'), TAG),
+)
+
+
+def key_type(key: str) -> str | None:
+    for pattern, kind in KEY_TYPES:
+        if pattern.match(key):
+            return kind
+    return None
+
+
+def expiry(kind: str) -> int:
+    # Jittered, so entries filled together (a sync, a cold start) do not expire and miss together
+    ttl = TTLS[kind]
+    return ttl + random.randint(0, int(ttl * CACHE_TTL_JITTER))
+
+
+class CacheMetrics:
+
+    def __init__(self):
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+        self.evictions: Counter[str] = Counter()
+
+    def observe(self, kind: str, hit: bool) -> None:
+        (self.hits if hit else self.misses)[kind] += 1
+
+    def observe_eviction(self, key: str) -> None:
+        kind = key_type(key)
+        if kind is not None:
+            self.evictions[kind] += 1
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        return {kind: {'hits': self.hits[kind],
+                       'misses': self.misses[kind],
+                       'evictions': self.evictions[kind]} for kind in (*TTLS, TAG)}
+
+
+cache_metrics = CacheMetrics()
+
+
+# A sliding hit renews the tags of the key as well: a key read often enough would otherwise outlive them, and
+# an invalidation of its parent would miss it
+async def read_body(redis: Redis, key: str, kind: str, tags: Iterable[str] = ()) -> bytes | None:
+    if not CACHE_SLIDING_EXPIRY:
+        return await redis.get(key)
+
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.getex(key, ex=expiry(kind))
+        renew_tags(pipe, tags)
+        body, *_ = await pipe.execute()
+
+    return body
+
+
+async def read_fields(redis: Redis, key: str, kind: str, *fields: str, tags: Iterable[str] = ()) -> list[bytes | None]:
+    if not CACHE_SLIDING_EXPIRY:
+        return await redis.hmget(key, *fields)
+
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hmget(key, *fields)
+        pipe.expire(key, expiry(kind))
+        renew_tags(pipe, tags)
+        values, *_ = await pipe.execute()
+
+    return values
+
+
+def renew_tags(pipe: Pipeline, tags: Iterable[str]) -> None:
+    for tag in tags:
+        pipe.expire(tag, TAG_TTL)
+
+
+async def configure_cache(redis: Redis) -> None:
+    # Managed Redis often forbids CONFIG: the budget and notifications are then set on the server itself
+    try:
+        if CACHE_MAXMEMORY:
+            await redis.config_set('maxmemory', CACHE_MAXMEMORY)
+            await redis.config_set('maxmemory-policy', CACHE_MAXMEMORY_POLICY)
+
+        if CACHE_TRACK_EVICTIONS:
+            events = next(iter((await redis.config_get('notify-keyspace-events')).values()), '')
+            if isinstance(events, bytes):
+                events = events.decode('utf-8')
+            await redis.config_set('notify-keyspace-events', ''.join(set(events) | {'E', 'e'}))
+    except ResponseError:
+        logger.warning('Could not configure the Redis cache, set maxmemory and notify-keyspace-events on the server')
+
+
+async def watch_evictions(redis: Redis) -> None:
+    # Every worker receives every eviction, so each reports the evictions of the whole cache
+    db = redis.connection_pool.connection_kwargs.get('db', 0)
+
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(f'__keyevent@{db}__:evicted')
+
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        key = message['data']
+                        cache_metrics.observe_eviction(key.decode('utf-8') if isinstance(key, bytes) else key)
+        except (ConnectionError, TimeoutError):
+            logger.warning('Lost the eviction notifications, resubscribing')  # Evictions meanwhile go uncounted
+            await asyncio.sleep(1)
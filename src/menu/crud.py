@@ -1,15 +1,30 @@
+from decimal import Decimal
 from uuid import UUID
 
-from sqlalchemy import distinct, func, select
-from sqlalchemy.orm import joinedload
-from sqlalchemy.sql.selectable import Select
+from sqlalchemy import (
+    Numeric,
+    String,
+    bindparam,
+    cast,
+    column,
+    distinct,
+    func,
+    literal,
+    select,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import Select, TableValuedAlias
 
 from .models import Dish, Menu, Submenu
 
 
 def count_submenus_and_dishes_in_one_request_menu(*, menu_id: UUID | None = None) -> Select:
-    major_query = (select(Menu,
-                          func.count(distinct(Submenu.id).label('submenus_count')),
+    major_query = (select(cast(Menu.id, String).label('id'),
+                          Menu.title,
+                          Menu.description,
+                          func.count(distinct(Submenu.id)).label('submenus_count'),
                           func.count(distinct(Dish.id)).label('dishes_count'))
                    .join(Menu.submenus, isouter=True)
                    .join(Submenu.dishes, isouter=True))
@@ -22,10 +37,97 @@ def count_submenus_and_dishes_in_one_request_menu(*, menu_id: UUID | None = None
     return query
 
 
-def get_all_data_query() -> Select:
-    query = (select(Menu)
-             .options(
-        joinedload(Menu.submenus)
-        .joinedload(Submenu.dishes)))
+def count_dishes_in_one_request_submenu(*,
+                                        submenu_id: UUID | None = None,
+                                        menu_id: UUID | None = None) -> Select:
+    major_query = (select(cast(Submenu.id, String).label('id'),
+                          Submenu.title,
+                          Submenu.description,
+                          func.count(Dish.id).label('dishes_count'))
+                   .join(Submenu.dishes, isouter=True))
+
+    if submenu_id:
+        major_query = major_query.where(Submenu.id == submenu_id)
+    if menu_id:
+        major_query = major_query.where(Submenu.menu_id == menu_id)
+
+    query = major_query.group_by(Submenu.id, Submenu.title, Submenu.description)
+
+    return query
+
+
+def menu_retrieve_columns(*, created: bool = False) -> tuple:
+    if created:
+        counts = (literal(0).label('submenus_count'), literal(0).label('dishes_count'))
+    else:
+        counts = (select(func.count(Submenu.id))
+                  .where(Submenu.menu_id == Menu.id)
+                  .correlate(Menu)
+                  .scalar_subquery()
+                  .label('submenus_count'),
+                  select(func.count(Dish.id))
+                  .join(Dish.submenu)
+                  .where(Submenu.menu_id == Menu.id)
+                  .correlate(Menu)
+                  .scalar_subquery()
+                  .label('dishes_count'))
+
+    return cast(Menu.id, String).label('id'), Menu.title, Menu.description, *counts
+
+
+def submenu_retrieve_columns(*, created: bool = False) -> tuple:
+    if created:
+        dishes_count = literal(0).label('dishes_count')
+    else:
+        dishes_count = (select(func.count(Dish.id))
+                        .where(Dish.submenu_id == Submenu.id)
+                        .correlate(Submenu)
+                        .scalar_subquery()
+                        .label('dishes_count'))
+
+    return cast(Submenu.id, String).label('id'), Submenu.title, Submenu.description, dishes_count
+
+
+def dish_retrieve_columns(*, created: bool = False) -> tuple:
+    return cast(Dish.id, String).label('id'), Dish.title, Dish.description, Dish.price
+
+
+def discount_table(discounts: dict[str, str]) -> TableValuedAlias:
+    # The discount index as a relation, so that a whole listing or tree is discounted by one join
+    ids = bindparam('discount_ids', [UUID(pk) for pk in discounts], type_=ARRAY(PG_UUID(as_uuid=True)))
+    values = bindparam('discount_values', [Decimal(value) for value in discounts.values()], type_=ARRAY(Numeric))
+
+    return func.unnest(ids, values).table_valued(column('dish_id'), column('discount')).render_derived(name='discount')
+
+
+def discounted_price(discount: TableValuedAlias) -> ColumnElement:
+    price = Dish.price * (100 - func.coalesce(discount.c.discount, 0)) / 100
+    return func.round(price, 2, type_=Numeric(10, 2)).label('price')
+
+
+def dish_list_query(*, submenu_id: UUID, discounts: dict[str, str] | None = None) -> Select:
+    if not discounts:
+        return select(*dish_retrieve_columns()).where(Dish.submenu_id == submenu_id)
+
+    discount = discount_table(discounts)
+    query = (select(cast(Dish.id, String).label('id'), Dish.title, Dish.description, discounted_price(discount))
+             .join(discount, discount.c.dish_id == Dish.id, isouter=True)
+             .where(Dish.submenu_id == submenu_id))
 
     return query
+
+
+def get_all_data_flat_query(discounts: dict[str, str] | None = None) -> Select:
+    # One row per dish (or per empty menu/submenu), ordered so that the tree can be emitted in one pass
+    discount = discount_table(discounts) if discounts else None
+    query = (select(Menu.id, Menu.title, Menu.description,
+                    Submenu.id, Submenu.title, Submenu.description,
+                    Dish.id, Dish.title, Dish.description,
+                    discounted_price(discount) if discount is not None else Dish.price)
+             .join(Menu.submenus, isouter=True)
+             .join(Submenu.dishes, isouter=True))
+
+    if discount is not None:
+        query = query.join(discount, discount.c.dish_id == Dish.id, isouter=True)
+
+    return query.order_by(Menu.id, Submenu.id, Dish.id)
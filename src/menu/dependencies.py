@@ -1,14 +1,24 @@
+from typing import AsyncGenerator
+
+from fastapi import Depends
+
 from src.menu.repository import DishRepository, MenuRepository, SubmenuRepository
 from src.menu.service import DishService, MenuService, SubmenuService
+from src.unit_of_work import UnitOfWork
+
+
+async def get_unit_of_work() -> AsyncGenerator[UnitOfWork, None]:
+    async with UnitOfWork() as uow:
+        yield uow
 
 
-def get_menu_service() -> MenuService:
-    return MenuService(MenuRepository())
+def get_menu_service(uow: UnitOfWork = Depends(get_unit_of_work)) -> MenuService:
+    return MenuService(MenuRepository(uow.session), uow)
 
 
-def get_submenu_service() -> SubmenuService:
-    return SubmenuService(SubmenuRepository())
+def get_submenu_service(uow: UnitOfWork = Depends(get_unit_of_work)) -> SubmenuService:
+    return SubmenuService(SubmenuRepository(uow.session), uow)
 
 
-def get_dish_service() -> DishService:
-    return DishService(DishRepository())
+def get_dish_service(uow: UnitOfWork = Depends(get_unit_of_work)) -> DishService:
+    return DishService(DishRepository(uow.session), uow)
@@ -0,0 +1,56 @@
+import hashlib
+import logging
+import os
+import threading
+from collections.abc import Iterable
+
+from .sheets_parser import WORKBOOK_PATH, DishRow, SheetRow, iter_rows
+
+logger = logging.getLogger(__name__)
+
+
+def parse_discounts(rows: Iterable[SheetRow]) -> dict[str, str]:
+    return {row.id: row.discount for row in rows if isinstance(row, DishRow) and row.discount}
+
+
+class DiscountIndex:
+
+    def __init__(self, path: str = WORKBOOK_PATH):
+        self.path = path
+        self._discounts: dict[str, str] = {}
+        self._mtime: float | None = None
+        self._digest: str | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> dict[str, str]:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return self._discounts
+
+        if mtime != self._mtime:
+            self._refresh(mtime)
+
+        return self._discounts
+
+    def _refresh(self, mtime: float) -> None:
+        with self._lock:
+            if mtime == self._mtime:  # Another thread has already rebuilt the index
+                return
+
+            with open(self.path, 'rb') as file:
+                digest = hashlib.sha256(file.read()).hexdigest()
+
+            # Read once per change: an invalid workbook is remembered too, so it does not fail every request
+            if digest != self._digest:
+                # Readers keep using the old dict until the new one is fully built
+                try:
+                    self._discounts = parse_discounts(iter_rows(self.path))
+                except Exception:
+                    logger.exception('Could not read the discounts of %s, keeping the previous ones', self.path)
+                self._digest = digest
+
+            self._mtime = mtime
+
+
+discount_index = DiscountIndex()
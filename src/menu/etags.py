@@ -0,0 +1,30 @@
+import hashlib
+from collections.abc import Iterable
+
+from fastapi import Request
+from fastapi.exceptions import HTTPException
+
+from .versions import read_etag
+
+
+def compute_etag(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+
+    # '*' is left unmatched: the ETag is derived from version counters, so it tells nothing of whether the entity exists
+    candidates = {candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')}
+    return etag in candidates
+
+
+async def check_not_modified(request: Request, versions: Iterable[str]) -> str:
+    # Costs one HMGET; raised before the db or the cache is touched
+    etag = await read_etag(request.app.state.redis, versions)
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        raise HTTPException(status_code=304, headers={'ETag': etag})
+
+    return etag
@@ -12,3 +12,7 @@ class NoSuchSubmenuError(RestaurantException):
 
 class NoSuchDishError(RestaurantException):
     pass
+
+
+class InvalidCursorError(RestaurantException):
+    pass
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError, TimeoutError
+
+from src.config import CACHE_LOCAL_MAXSIZE, CACHE_LOCAL_TTL
+
+logger = logging.getLogger(__name__)
+
+# Redis keys changed by a write are published here, every worker drops its copies of them
+INVALIDATION_CHANNEL = 'cache:invalidate'
+
+
+class LocalCache:
+    # In-process LRU of ready response bodies and ETags, in front of Redis. Entries are addressed by the Redis key
+    # they were read from and a field (a listing page, a set of version counters), so dropping a Redis key drops
+    # every entry read from it. The TTL bounds staleness when an invalidation message is lost.
+
+    def __init__(self, maxsize: int = CACHE_LOCAL_MAXSIZE, ttl: float = CACHE_LOCAL_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, Hashable], tuple[float, Any]] = OrderedDict()
+        self._fields: dict[str, set[Hashable]] = {}
+
+    def get(self, key: str, field: Hashable = None) -> Any:
+        entry = self._entries.get((key, field))
+
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove((key, field))
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end((key, field))
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, field: Hashable, value: Any, generation: int) -> None:
+        # `generation` is read before the value was: an invalidation in between means the value may be stale
+        if not self.maxsize or generation != self.generation:
+            return
+
+        self._entries[(key, field)] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end((key, field))
+        self._fields.setdefault(key, set()).add(field)
+
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def drop(self, keys: Iterable[str]) -> None:
+        self.generation += 1
+
+        for key in keys:
+            for field in self._fields.pop(key, ()):
+                self._entries.pop((key, field), None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._fields.clear()
+
+    def snapshot(self) -> dict[str, int]:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _remove(self, entry_key: tuple[str, Hashable]) -> None:
+        key, field = entry_key
+        del self._entries[entry_key]
+
+        fields = self._fields.get(key)
+        if fields is not None:
+            fields.discard(field)
+            if not fields:
+                del self._fields[key]
+
+
+local_cache = LocalCache()
+
+
+def encode_keys(keys: Iterable[str | bytes]) -> list[str]:
+    return [key.decode('utf-8') if isinstance(key, bytes) else key for key in keys]
+
+
+async def broadcast(redis: Redis, keys: Iterable[str | bytes]) -> None:
+    # Called once the keys have changed in Redis, so no worker can read their old values back
+    keys = encode_keys(keys)
+    await redis.publish(INVALIDATION_CHANNEL, orjson.dumps(keys))
+    local_cache.drop(keys)
+
+
+async def watch_invalidations(redis: Redis) -> None:
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                local_cache.clear()  # Whatever was published while we were not subscribed is lost
+
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        local_cache.drop(orjson.loads(message['data']))
+        except (ConnectionError, TimeoutError):
+            local_cache.clear()
+            logger.warning('Lost the cache invalidation channel, resubscribing')
+            await asyncio.sleep(1)
@@ -1,13 +1,15 @@
 import uuid
+from decimal import Decimal
 from typing import Annotated
 
-from sqlalchemy import ForeignKey
+from redis.asyncio import Redis
+from sqlalchemy import ForeignKey, Numeric
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 from src.database import engine
-from src.menu.schemas import DishRetrieve, MenuRetrieve, SubmenuRetrieve
-from src.menu.utils import get_dishes_count_from_menu
+from src.menu.redis_utils import SYNC_KEYS
+from src.menu.schemas import DishRetrieve
 
 
 class Base(DeclarativeBase):
@@ -26,15 +28,6 @@ class Menu(AsyncAttrs, Base):
     submenus: Mapped[list['Submenu']] = relationship('Submenu', back_populates='menu',
                                                      cascade='all,delete')
 
-    def to_pydantic_model(self) -> MenuRetrieve:
-        return MenuRetrieve(
-            id=str(self.id),
-            title=self.title,
-            description=self.description,
-            submenus_count=len(self.submenus),
-            dishes_count=get_dishes_count_from_menu(self)
-        )
-
 
 class Submenu(AsyncAttrs, Base):
     __tablename__ = 'submenu'
@@ -42,19 +35,11 @@ class Submenu(AsyncAttrs, Base):
     id: Mapped[uuid_pk]
     title: Mapped[str]
     description: Mapped[str]
-    menu_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('menu.id', ondelete='CASCADE'))
+    menu_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('menu.id', ondelete='CASCADE'), index=True)
     menu: Mapped[Menu] = relationship('Menu', back_populates='submenus')
     dishes: Mapped[list['Dish']] = relationship('Dish', back_populates='submenu',
                                                 cascade='all,delete')
 
-    def to_pydantic_model(self) -> SubmenuRetrieve:
-        return SubmenuRetrieve(
-            id=str(self.id),
-            title=self.title,
-            description=self.description,
-            dishes_count=len(self.dishes)
-        )
-
 
 class Dish(AsyncAttrs, Base):
     __tablename__ = 'dish'
@@ -62,8 +47,8 @@ class Dish(AsyncAttrs, Base):
     id: Mapped[uuid_pk]
     title: Mapped[str]
     description: Mapped[str]
-    price: Mapped[str]
-    submenu_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('submenu.id', ondelete='CASCADE'))
+    price: Mapped[Decimal] = mapped_column(Numeric(10, 2))
+    submenu_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('submenu.id', ondelete='CASCADE'), index=True)
     submenu: Mapped[Submenu] = relationship('Submenu', back_populates='dishes')
 
     def to_pydantic_model(self) -> DishRetrieve:
@@ -75,7 +60,8 @@ class Dish(AsyncAttrs, Base):
         )
 
 
-async def init_db() -> None:
+async def init_db(redis: Redis) -> None:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+    await redis.unlink(*SYNC_KEYS)  # Redis outlives the tables, the next sync must start from the empty ones
@@ -0,0 +1,30 @@
+import base64
+import binascii
+from uuid import UUID
+
+from .exceptions import InvalidCursorError
+
+# Keyset pagination: a cursor is the opaque form of the last id of the previous page
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(last_id: str) -> str:
+    return base64.urlsafe_b64encode(UUID(last_id).bytes).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str | None) -> UUID | None:
+    if not cursor:
+        return None
+
+    try:
+        return UUID(bytes=base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise InvalidCursorError
+
+
+def page_field(cursor: str | None, limit: int) -> str:
+    return f'{cursor or ""}:{limit}'
+
+
+def next_cursor_field(field: str) -> str:
+    return f'{field}:next'
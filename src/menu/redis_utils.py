@@ -1,8 +1,192 @@
-from redis import Redis
+from collections.abc import Iterable, Mapping
 
+import orjson
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
 
-def delete_if_keys_exists(redis: Redis, pattern: str) -> None:
-    list_keys = redis.keys(pattern)
+from .cache_policy import TAG_TTL
+from .local_cache import INVALIDATION_CHANNEL, broadcast, encode_keys, local_cache
 
-    if list_keys:
-        redis.delete(*list_keys)
+MENU_LIST_KEY = 'list:menu'
+
+
+def submenu_list_key(menu_id) -> str:
+    return f'list:submenu:{menu_id}'
+
+
+def dish_list_key(menu_id, submenu_id) -> str:
+    return f'list:dish:{menu_id}:{submenu_id}'
+
+
+def menu_key(menu_id) -> str:
+    return f'{menu_id}::'
+
+
+def submenu_key(menu_id, submenu_id) -> str:
+    return f'{menu_id}:{submenu_id}:'
+
+
+def dish_key(menu_id, submenu_id, dish_id) -> str:
+    return f'{menu_id}:{submenu_id}:{dish_id}'
+
+
+# Index sets: every key cached below a menu or submenu is registered in the set of each of its parents,
+# so a subtree can be dropped without scanning the keyspace.
+
+def menu_tag(menu_id) -> str:
+    return f'tag:{menu_id}'
+
+
+def submenu_tag(menu_id, submenu_id) -> str:
+    return f'tag:{menu_id}:{submenu_id}'
+
+
+# Entities are cached as the JSON bytes of their response body, so a hit is sent as is
+
+def add_tags(pipe: Pipeline, key: str, tags: Iterable[str]) -> None:
+    for tag in tags:
+        pipe.sadd(tag, key)
+        pipe.expire(tag, TAG_TTL)
+
+
+# Fills run in MULTI: a value must never be visible without its tags, or an invalidation in between misses it
+async def cache_body(redis: Redis, key: str, body: bytes, tags: Iterable[str] = (), ttl: int | None = None) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(key, body, ex=ttl)
+        add_tags(pipe, key, tags)
+        await pipe.execute()
+
+
+async def cache_page(redis: Redis,
+                     key: str,
+                     mapping: Mapping,
+                     tags: Iterable[str] = (),
+                     ttl: int | None = None) -> None:
+    # All pages of a listing are fields of one hash, so dropping the listing key drops every page.
+    # A page and its next cursor are one HSET: there is no partially filled listing to read.
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping=mapping)
+        if ttl is not None:
+            pipe.expire(key, ttl, nx=True)  # Counted from the first page, later pages do not extend the others
+        add_tags(pipe, key, tags)
+        await pipe.execute()
+
+
+# Patches a counter inside a cached body without caching anything when the key is not cached. Only the digits of
+# the counter are replaced, the rest of the bytes stay as orjson wrote them (a quote inside a string is escaped, so
+# only the field itself matches). A body without the counter is dropped.
+INCR_FIELD_IF_EXISTS = """
+local body = redis.call('GET', KEYS[1])
+if not body then
+    return false
+end
+local field = '"' .. ARGV[1]:gsub('%p', '%%%0') .. '":'
+local value = tonumber(body:match(field .. '(%-?%d+)'))
+if not value then
+    redis.call('UNLINK', KEYS[1])
+    return false
+end
+value = value + tonumber(ARGV[2])
+redis.call('SET', KEYS[1], (body:gsub(field .. '%-?%d+', '"' .. ARGV[1] .. '":' .. value, 1)), 'KEEPTTL')
+return value
+"""
+
+
+async def write_through(redis: Redis,
+                        key: str,
+                        body: bytes,
+                        tags: Iterable[str] = (),
+                        counters: Iterable[tuple[str, str, int]] = (),
+                        unlink: Iterable[str] = (),
+                        ttl: int | None = None) -> None:
+    counters = list(counters)
+    keys_to_unlink = list(unlink)
+    changed = encode_keys([key, *(counter_key for counter_key, _, _ in counters), *keys_to_unlink])
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(key, body, ex=ttl)
+        add_tags(pipe, key, tags)
+        for counter_key, field, amount in counters:
+            pipe.eval(INCR_FIELD_IF_EXISTS, 1, counter_key, field, amount)
+        if keys_to_unlink:
+            pipe.unlink(*keys_to_unlink)
+        pipe.publish(INVALIDATION_CHANNEL, orjson.dumps(changed))
+        await pipe.execute()
+
+    local_cache.drop(changed)
+
+
+# Reads the tags and drops them with their members in one step, so a fill tagged in between is not left untagged
+INVALIDATE_TAGS = """
+local keys = ARGV
+for _, tag in ipairs(KEYS) do
+    for _, member in ipairs(redis.call('SMEMBERS', tag)) do
+        keys[#keys + 1] = member
+    end
+    keys[#keys + 1] = tag
+end
+for i = 1, #keys, 1000 do
+    redis.call('UNLINK', unpack(keys, i, math.min(i + 999, #keys)))
+end
+return keys
+"""
+
+
+async def invalidate(redis: Redis, *tags: str, keys: Iterable[str] = ()) -> None:
+    keys = list(keys)
+
+    if tags:
+        keys = await redis.eval(INVALIDATE_TAGS, len(tags), *tags, *keys)
+    elif keys:
+        await redis.unlink(*keys)
+
+    if keys:
+        await broadcast(redis, keys)
+
+
+# State of the last workbook applied by src/menu/tasks_utils.py::synchronize. It only describes the tables it was
+# applied to, so it is dropped together with them.
+SYNC_STAT_KEY = 'sync:stat'
+SYNC_FINGERPRINT_KEY = 'sync:fingerprint'
+SYNC_TABLES_KEY = 'sync:tables'
+SYNC_ROWS_KEYS = ('sync:rows:menu', 'sync:rows:submenu', 'sync:rows:dish')
+SYNC_DISCOUNTS_KEY = 'sync:discounts'
+SYNC_KEYS = (SYNC_STAT_KEY, SYNC_FINGERPRINT_KEY, SYNC_TABLES_KEY, *SYNC_ROWS_KEYS, SYNC_DISCOUNTS_KEY)
+
+
+# A write through the API makes the tables differ from the workbook while the workbook stays the same: without its
+# applied state the next sync compares the whole workbook with the tables and restores the rows it describes
+async def expire_sync_state(redis: Redis) -> None:
+    await redis.unlink(SYNC_STAT_KEY, SYNC_FINGERPRINT_KEY, *SYNC_ROWS_KEYS)
+
+
+# Pre-serialized tree of /menus/dependencies. Every write bumps the generation, so a rebuild that
+# started before the write cannot store its (stale) result afterwards.
+TREE_SNAPSHOT_KEY = 'snapshot:tree'
+TREE_GENERATION_KEY = 'snapshot:tree:generation'
+
+STORE_IF_GENERATION = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'body', ARGV[2], 'etag', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+async def expire_tree_snapshot(redis: Redis) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.incr(TREE_GENERATION_KEY)
+        pipe.unlink(TREE_SNAPSHOT_KEY)
+        await pipe.execute()
+
+
+async def store_tree_snapshot(redis: Redis, generation: bytes | None, body: bytes, etag: str) -> bool:
+    stored = await redis.eval(STORE_IF_GENERATION,
+                              2,
+                              TREE_SNAPSHOT_KEY,
+                              TREE_GENERATION_KEY,
+                              generation or b'',
+                              body,
+                              etag)
+    return bool(stored)
@@ -1,57 +1,87 @@
+from typing import Sequence
 from uuid import UUID
 
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.menu.models import Dish, Menu, Submenu
 from src.repositories import SQLAlchemyRepository
 
+from .crud import (
+    count_dishes_in_one_request_submenu,
+    count_submenus_and_dishes_in_one_request_menu,
+    dish_list_query,
+    dish_retrieve_columns,
+    menu_retrieve_columns,
+    submenu_retrieve_columns,
+)
+
 
 class MenuRepository(SQLAlchemyRepository):
 
-    def __init__(self):
-        super().__init__(Menu)
+    def __init__(self, session: AsyncSession):
+        super().__init__(Menu, session)
+
+    def returning_columns(self, *, created: bool = False) -> tuple:
+        return menu_retrieve_columns(created=created)
 
-    async def retrieve_list(self) -> list[Menu]:
-        async with (self.session_maker() as session):
-            query = select(self.model).options(selectinload(self.model.submenus)
-                                               .selectinload(Submenu.dishes))
-            result = await session.execute(query)
+    async def retrieve_list(self, after: UUID | None = None, limit: int | None = None) -> Sequence[Row]:
+        query = self.paginate(count_submenus_and_dishes_in_one_request_menu(), after, limit)
+        result = await self.session.execute(query)
 
-            return result.scalars().all()
+        return result.all()
 
-    async def retrieve_one(self, pk: UUID) -> Menu:
-        async with self.session_maker() as session:
-            query = (select(self.model).options(selectinload(self.model.submenus)
-                                                .selectinload(Submenu.dishes))
-                     .where(self.model.id == pk))
-            res = await session.execute(query)
+    async def retrieve_one(self, pk: UUID) -> Row | None:
+        query = count_submenus_and_dishes_in_one_request_menu(menu_id=pk)
+        res = await self.session.execute(query)
 
-            return res.scalars().first()
+        return res.first()
 
 
 class SubmenuRepository(SQLAlchemyRepository):
 
-    def __init__(self):
-        super().__init__(Submenu)
+    def __init__(self, session: AsyncSession):
+        super().__init__(Submenu, session)
+
+    def returning_columns(self, *, created: bool = False) -> tuple:
+        return submenu_retrieve_columns(created=created)
+
+    async def retrieve_list(self) -> Sequence[Row]:
+        query = count_dishes_in_one_request_submenu()
+        result = await self.session.execute(query)
 
-    async def retrieve_list(self) -> list[Submenu]:
-        async with self.session_maker() as session:
-            query = select(self.model).options(selectinload(self.model.dishes))
-            result = await session.execute(query)
+        return result.all()
 
-            return result.scalars().all()
+    async def retrieve_list_by_menu_id(self,
+                                       menu_id: UUID,
+                                       after: UUID | None = None,
+                                       limit: int | None = None) -> Sequence[Row]:
+        query = self.paginate(count_dishes_in_one_request_submenu(menu_id=menu_id), after, limit)
+        result = await self.session.execute(query)
 
-    async def retrieve_one(self, pk: UUID) -> Submenu:
-        async with self.session_maker() as session:
-            query = (select(self.model).options(selectinload(self.model.dishes))
-                     .where(self.model.id == pk))
-            res = await session.execute(query)
+        return result.all()
 
-            return res.scalars().first()
+    async def retrieve_one(self, pk: UUID) -> Row | None:
+        query = count_dishes_in_one_request_submenu(submenu_id=pk)
+        res = await self.session.execute(query)
+
+        return res.first()
 
 
 class DishRepository(SQLAlchemyRepository):
 
-    def __init__(self):
-        super().__init__(Dish)
+    def __init__(self, session: AsyncSession):
+        super().__init__(Dish, session)
+
+    def returning_columns(self, *, created: bool = False) -> tuple:
+        return dish_retrieve_columns(created=created)
+
+    async def retrieve_list_by_submenu_id(self,
+                                          submenu_id: UUID,
+                                          after: UUID | None = None,
+                                          limit: int | None = None,
+                                          discounts: dict[str, str] | None = None) -> Sequence[Row]:
+        query = self.paginate(dish_list_query(submenu_id=submenu_id, discounts=discounts), after, limit)
+        result = await self.session.execute(query)
+
+        return result.all()
@@ -1,23 +1,33 @@
-MENU_NOT_FOUND = {404: {'description': 'Menu not found',
-                        'content': {
-                            'application/json': {
-                                'example': {'detail': 'menu not found'}
-                            }
-                        }}
-                  }
+from typing import Any
 
-SUBMENU_NOT_FOUND = {404: {'description': 'Submenu not found',
-                           'content': {
-                               'application/json': {
-                                   'example': {'detail': 'submenu not found'}
-                               }
-                           }}
-                     }
+MENU_NOT_FOUND: dict[int | str, dict[str, Any]] = {404: {'description': 'Menu not found',
+                                                         'content': {
+                                                             'application/json': {
+                                                                 'example': {'detail': 'menu not found'}
+                                                             }
+                                                         }}
+                                                   }
 
-DISH_NOT_FOUND = {404: {'description': 'Dish not found',
-                        'content': {
-                            'application/json': {
-                                'example': {'detail': 'dish not found'}
-                            }
-                        }}
-                  }
+SUBMENU_NOT_FOUND: dict[int | str, dict[str, Any]] = {404: {'description': 'Submenu not found',
+                                                            'content': {
+                                                                'application/json': {
+                                                                    'example': {'detail': 'submenu not found'}
+                                                                }
+                                                            }}
+                                                      }
+
+DISH_NOT_FOUND: dict[int | str, dict[str, Any]] = {404: {'description': 'Dish not found',
+                                                         'content': {
+                                                             'application/json': {
+                                                                 'example': {'detail': 'dish not found'}
+                                                             }
+                                                         }}
+                                                   }
+
+INVALID_CURSOR: dict[int | str, dict[str, Any]] = {400: {'description': 'Invalid pagination cursor',
+                                                         'content': {
+                                                             'application/json': {
+                                                                 'example': {'detail': 'invalid cursor'}
+                                                             }
+                                                         }}
+                                                   }
@@ -1,20 +1,45 @@
 from uuid import UUID
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request, Response
 from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
 
+from ..config import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+from ..database import pool_metrics
+from .cache_policy import cache_metrics
 from .dependencies import get_dish_service, get_menu_service, get_submenu_service
-from .exceptions import NoSuchDishError, NoSuchMenuError, NoSuchSubmenuError
-from .responses import DISH_NOT_FOUND, MENU_NOT_FOUND, SUBMENU_NOT_FOUND
+from .etags import check_not_modified, etag_matches
+from .exceptions import (
+    InvalidCursorError,
+    NoSuchDishError,
+    NoSuchMenuError,
+    NoSuchSubmenuError,
+)
+from .local_cache import local_cache
+from .pagination import NEXT_CURSOR_HEADER
+from .responses import DISH_NOT_FOUND, INVALID_CURSOR, MENU_NOT_FOUND, SUBMENU_NOT_FOUND
 from .schemas import (
+    DishBatch,
+    DishBatchResult,
     DishCreateUpdate,
     DishRetrieve,
     MenuCreateUpdate,
     MenuRetrieve,
+    SubmenuBatch,
+    SubmenuBatchResult,
     SubmenuCreateUpdate,
     SubmenuRetrieve,
 )
 from .service import DishService, MenuService, SubmenuService
+from .single_flight import single_flight
+from .versions import (
+    dish_list_versions,
+    dish_versions,
+    menu_list_versions,
+    menu_versions,
+    submenu_list_versions,
+    submenu_versions,
+)
 
 router = APIRouter(
     prefix='/api/v1/menus',
@@ -23,19 +48,42 @@ router = APIRouter(
 
 # Endpoints for Menu
 
-@router.get('/', response_model=list[MenuRetrieve])
+@router.get('/', response_model=list[MenuRetrieve], responses={**INVALID_CURSOR})
 async def get_menus(request: Request,
                     background_tasks: BackgroundTasks,
-                    service: MenuService = Depends(get_menu_service)) -> list[MenuRetrieve]:
-    menus = await service.retrieve_list(background_tasks=background_tasks,
-                                        redis=request.app.state.redis)
-    return menus
+                    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                    cursor: str | None = None,
+                    service: MenuService = Depends(get_menu_service)) -> Response:
+    etag = await check_not_modified(request, menu_list_versions())
+
+    try:
+        body, next_cursor = await service.retrieve_list(background_tasks=background_tasks,
+                                                        redis=request.app.state.redis,
+                                                        limit=limit,
+                                                        cursor=cursor)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail='invalid cursor')
+
+    headers = {'ETag': etag}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return Response(content=body, media_type='application/json', headers=headers)
 
 
 @router.get('/dependencies')
-async def get_menus_with_dependencies(service: MenuService = Depends(get_menu_service)):
-    menus_with_dependencies = await service.retrieve_list_with_dependencies()
-    return menus_with_dependencies
+async def get_menus_with_dependencies(request: Request,
+                                      stream: bool = False,
+                                      service: MenuService = Depends(get_menu_service)) -> Response:
+    if stream:
+        return StreamingResponse(service.stream_list_with_dependencies(), media_type='application/json')
+
+    body, etag = await service.retrieve_tree_snapshot(redis=request.app.state.redis)
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers={'ETag': etag})
+
+    return Response(content=body, media_type='application/json', headers={'ETag': etag})
 
 
 @router.get('/{menu_id}',
@@ -44,15 +92,17 @@ async def get_menus_with_dependencies(service: MenuService = Depends(get_menu_se
 async def get_menu(menu_id: UUID,
                    request: Request,
                    background_tasks: BackgroundTasks,
-                   service: MenuService = Depends(get_menu_service)) -> MenuRetrieve:
+                   service: MenuService = Depends(get_menu_service)) -> Response:
+    etag = await check_not_modified(request, menu_versions(menu_id))
+
     try:
-        menu = await service.retrieve_one(menu_id,
+        body = await service.retrieve_one(menu_id,
                                           background_tasks=background_tasks,
                                           redis=request.app.state.redis)
     except NoSuchMenuError:
         raise HTTPException(status_code=404, detail='menu not found')
 
-    return menu
+    return Response(content=body, media_type='application/json', headers={'ETag': etag})
 
 
 @router.post('/', status_code=201, response_model=MenuRetrieve)
@@ -105,15 +155,29 @@ async def delete_menu(menu_id: UUID,
 
 # Endpoints for Submenu
 
-@router.get('/{menu_id}/submenus', response_model=list[SubmenuRetrieve])
+@router.get('/{menu_id}/submenus', response_model=list[SubmenuRetrieve], responses={**INVALID_CURSOR})
 async def get_submenus(menu_id: UUID,
                        request: Request,
                        background_tasks: BackgroundTasks,
-                       service: SubmenuService = Depends(get_submenu_service)) -> list[SubmenuRetrieve]:
-    submenus = await service.retrieve_list_by_menu_id(menu_id,
-                                                      background_tasks=background_tasks,
-                                                      redis=request.app.state.redis)
-    return submenus
+                       limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                       cursor: str | None = None,
+                       service: SubmenuService = Depends(get_submenu_service)) -> Response:
+    etag = await check_not_modified(request, submenu_list_versions(menu_id))
+
+    try:
+        body, next_cursor = await service.retrieve_list_by_menu_id(menu_id,
+                                                                   background_tasks=background_tasks,
+                                                                   redis=request.app.state.redis,
+                                                                   limit=limit,
+                                                                   cursor=cursor)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail='invalid cursor')
+
+    headers = {'ETag': etag}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return Response(content=body, media_type='application/json', headers=headers)
 
 
 @router.get('/{menu_id}/submenus/{submenu_id}',
@@ -123,16 +187,18 @@ async def get_submenu(menu_id: UUID,
                       submenu_id: UUID,
                       request: Request,
                       background_tasks: BackgroundTasks,
-                      service: SubmenuService = Depends(get_submenu_service)) -> SubmenuRetrieve:
+                      service: SubmenuService = Depends(get_submenu_service)) -> Response:
+    etag = await check_not_modified(request, submenu_versions(menu_id, submenu_id))
+
     try:
-        submenu = await service.retrieve_one(submenu_id,
-                                             background_tasks=background_tasks,
-                                             menu_id=menu_id,
-                                             redis=request.app.state.redis)
+        body = await service.retrieve_one(submenu_id,
+                                          background_tasks=background_tasks,
+                                          menu_id=menu_id,
+                                          redis=request.app.state.redis)
     except NoSuchSubmenuError:
         raise HTTPException(status_code=404, detail='submenu not found')
 
-    return submenu
+    return Response(content=body, media_type='application/json', headers={'ETag': etag})
 
 
 @router.post('/{menu_id}/submenus', status_code=201, response_model=SubmenuRetrieve)
@@ -194,18 +260,47 @@ async def delete_submenu(menu_id: UUID,
     return {'detail': 'submenu has been deleted'}
 
 
+@router.post('/{menu_id}/submenus:batch', response_model=SubmenuBatchResult)
+async def batch_submenus(menu_id: UUID,
+                         data: SubmenuBatch,
+                         request: Request,
+                         background_tasks: BackgroundTasks,
+                         service: SubmenuService = Depends(get_submenu_service)) -> SubmenuBatchResult:
+    result = await service.apply_batch(data.model_dump(),
+                                       background_tasks=background_tasks,
+                                       menu_id=menu_id,
+                                       redis=request.app.state.redis)
+
+    return result
+
+
 # Endpoints for Dish
 
-@router.get('/{menu_id}/submenus/{submenu_id}/dishes', response_model=list[DishRetrieve])
+@router.get('/{menu_id}/submenus/{submenu_id}/dishes', response_model=list[DishRetrieve], responses={**INVALID_CURSOR})
 async def get_dishes(menu_id: UUID,
                      submenu_id: UUID,
                      request: Request,
                      background_tasks: BackgroundTasks,
-                     service: DishService = Depends(get_dish_service)) -> list[DishRetrieve]:
-    dishes = await service.retrieve_list_by_submenu_id(submenu_id,
-                                                       background_tasks=background_tasks,
-                                                       redis=request.app.state.redis)
-    return dishes
+                     limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                     cursor: str | None = None,
+                     service: DishService = Depends(get_dish_service)) -> Response:
+    etag = await check_not_modified(request, dish_list_versions(menu_id, submenu_id))
+
+    try:
+        body, next_cursor = await service.retrieve_list_by_submenu_id(submenu_id,
+                                                                      background_tasks=background_tasks,
+                                                                      redis=request.app.state.redis,
+                                                                      menu_id=menu_id,
+                                                                      limit=limit,
+                                                                      cursor=cursor)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail='invalid cursor')
+
+    headers = {'ETag': etag}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return Response(content=body, media_type='application/json', headers=headers)
 
 
 @router.get('/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}',
@@ -216,9 +311,11 @@ async def get_dish(menu_id: UUID,
                    dish_id: UUID,
                    request: Request,
                    background_tasks: BackgroundTasks,
-                   service: DishService = Depends(get_dish_service)) -> DishRetrieve:
+                   service: DishService = Depends(get_dish_service)) -> Response:
+    etag = await check_not_modified(request, dish_versions(menu_id, submenu_id, dish_id))
+
     try:
-        dish = await service.retrieve_one(dish_id,
+        body = await service.retrieve_one(dish_id,
                                           background_tasks=background_tasks,
                                           redis=request.app.state.redis,
                                           menu_id=menu_id,
@@ -226,7 +323,7 @@ async def get_dish(menu_id: UUID,
     except NoSuchDishError:
         raise HTTPException(status_code=404, detail='dish not found')
 
-    return dish
+    return Response(content=body, media_type='application/json', headers={'ETag': etag})
 
 
 @router.post('/{menu_id}/submenus/{submenu_id}/dishes', status_code=201, response_model=DishRetrieve)
@@ -294,3 +391,35 @@ async def delete_dish(menu_id: UUID,
                          submenu_id=submenu_id)
 
     return {'detail': 'dish has been deleted'}
+
+
+@router.post('/{menu_id}/submenus/{submenu_id}/dishes:batch', response_model=DishBatchResult)
+async def batch_dishes(menu_id: UUID,
+                       submenu_id: UUID,
+                       data: DishBatch,
+                       request: Request,
+                       background_tasks: BackgroundTasks,
+                       service: DishService = Depends(get_dish_service)) -> DishBatchResult:
+    result = await service.apply_batch(data.model_dump(),
+                                       background_tasks=background_tasks,
+                                       redis=request.app.state.redis,
+                                       menu_id=menu_id,
+                                       submenu_id=submenu_id)
+
+    return result
+
+
+# Counters of this worker (`entities` counts the reads that reached Redis); evictions are reported by Redis and
+# count the whole cache
+
+stats_router = APIRouter(
+    prefix='/api/v1/stats',
+)
+
+
+@stats_router.get('/cache')
+async def get_cache_stats() -> dict:
+    return {'local': local_cache.snapshot(),
+            'entities': cache_metrics.snapshot(),
+            'single_flight': single_flight.metrics.snapshot(),
+            'db_pool': pool_metrics.snapshot()}
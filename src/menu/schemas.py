@@ -1,4 +1,13 @@
-from pydantic import BaseModel
+from decimal import Decimal
+from typing import Annotated
+from uuid import UUID
+
+from pydantic import BaseModel, ConfigDict, Field, PlainSerializer
+
+from src.config import BATCH_SIZE_MAX
+
+# Sent as a string with exactly two decimal places
+Price = Annotated[Decimal, PlainSerializer(lambda price: f'{price:.2f}', return_type=str)]
 
 
 class MenuCreateUpdate(BaseModel):
@@ -7,6 +16,8 @@ class MenuCreateUpdate(BaseModel):
 
 
 class MenuRetrieve(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     title: str
     description: str
@@ -20,6 +31,8 @@ class SubmenuCreateUpdate(BaseModel):
 
 
 class SubmenuRetrieve(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     title: str
     description: str
@@ -27,13 +40,49 @@ class SubmenuRetrieve(BaseModel):
 
 
 class DishRetrieve(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     title: str
     description: str
-    price: str
+    price: Price
 
 
 class DishCreateUpdate(BaseModel):
     title: str
     description: str
-    price: str
+    price: Decimal = Field(max_digits=10, decimal_places=2)  # Numeric(10, 2) of the dish table
+
+
+# Batches: every list is applied in one statement, and all of them in one transaction
+
+class SubmenuBatchUpdate(SubmenuCreateUpdate):
+    id: UUID
+
+
+class SubmenuBatch(BaseModel):
+    create: list[SubmenuCreateUpdate] = Field(default=[], max_length=BATCH_SIZE_MAX)
+    update: list[SubmenuBatchUpdate] = Field(default=[], max_length=BATCH_SIZE_MAX)
+    delete: list[UUID] = Field(default=[], max_length=BATCH_SIZE_MAX)
+
+
+class SubmenuBatchResult(BaseModel):
+    created: list[SubmenuRetrieve]
+    updated: list[SubmenuRetrieve]
+    deleted: list[str]
+
+
+class DishBatchUpdate(DishCreateUpdate):
+    id: UUID
+
+
+class DishBatch(BaseModel):
+    create: list[DishCreateUpdate] = Field(default=[], max_length=BATCH_SIZE_MAX)
+    update: list[DishBatchUpdate] = Field(default=[], max_length=BATCH_SIZE_MAX)
+    delete: list[UUID] = Field(default=[], max_length=BATCH_SIZE_MAX)
+
+
+class DishBatchResult(BaseModel):
+    created: list[DishRetrieve]
+    updated: list[DishRetrieve]
+    deleted: list[str]
@@ -1,302 +1,535 @@
-import json
-from typing import Any, Sequence
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Sequence
 from uuid import UUID
 
+import orjson
+from pydantic import BaseModel
 from sqlalchemy import Row, RowMapping
 
+from src.config import CACHE_WRITE_THROUGH, PAGE_SIZE_DEFAULT
 from src.menu.exceptions import (
     NoSuchDishError,
     NoSuchMenuError,
     NoSuchSubmenuError,
     RestaurantException,
 )
-from src.menu.models import Dish, Menu, Submenu
+from src.menu.models import Dish
 from src.repositories import AbstractRepository
-
-from .crud import get_all_data_query
-from .redis_utils import delete_if_keys_exists
-from .schemas import DishRetrieve, MenuRetrieve, SubmenuRetrieve
-from .utils import get_discounts
+from src.unit_of_work import UnitOfWork
+
+from .cache_policy import (
+    DISH,
+    DISH_LIST,
+    MENU,
+    MENU_LIST,
+    SUBMENU,
+    SUBMENU_LIST,
+    cache_metrics,
+    expiry,
+    read_body,
+    read_fields,
+)
+from .local_cache import local_cache
+from .pagination import decode_cursor, encode_cursor, next_cursor_field, page_field
+from .redis_utils import (
+    MENU_LIST_KEY,
+    cache_body,
+    cache_page,
+    dish_key,
+    dish_list_key,
+    expire_sync_state,
+    expire_tree_snapshot,
+    invalidate,
+    menu_key,
+    menu_tag,
+    submenu_key,
+    submenu_list_key,
+    submenu_tag,
+    write_through,
+)
+from .repository import DishRepository, MenuRepository, SubmenuRepository
+from .schemas import (
+    DishBatchResult,
+    DishRetrieve,
+    MenuRetrieve,
+    SubmenuBatchResult,
+    SubmenuRetrieve,
+)
+from .single_flight import single_flight
+from .snapshot import get_tree_snapshot, rebuild_tree_snapshot, stream_tree
+from .utils import apply_discount, get_discounts
+from .versions import (
+    bump_versions,
+    dish_write_versions,
+    menu_write_versions,
+    submenu_write_versions,
+)
 
 
 class RestaurantService:
     exception: type[RestaurantException]
+    write_through = CACHE_WRITE_THROUGH
 
-    def __init__(self, repository: AbstractRepository):
+    def __init__(self, repository: AbstractRepository, uow: UnitOfWork):
         self.repository = repository
+        self.uow = uow
 
-    async def retrieve_list(self, **kwargs) -> Sequence[Row[Menu | Submenu | Dish] | RowMapping | Any]:
+    async def retrieve_list(self, **kwargs) -> Sequence[Row | RowMapping | Any]:
         return await self.repository.retrieve_list()
 
-    async def retrieve_one(self, pk: UUID, **kwargs) -> Menu | Submenu | Dish:
-        obj = await self.repository.retrieve_one(pk)
+    @asynccontextmanager
+    async def detached_repository(self) -> AsyncIterator[AbstractRepository]:
+        # For single-flight loads: they are shared by every request that missed the key and outlive the one that
+        # started them, so they run on a unit of work of their own rather than on that request's session
+        async with UnitOfWork(self.uow.session_maker) as uow:
+            yield type(self.repository)(uow.session)  # type: ignore[call-arg]
+
+    async def retrieve_page(self,
+                            fetch: Callable[[Any, UUID | None, int], Awaitable[Sequence[Row]]],
+                            schema: type[BaseModel],
+                            key: str,
+                            tags: list[str],
+                            kind: str,
+                            **kwargs) -> tuple[bytes, str | None]:
+        redis = kwargs['redis']
+        limit = kwargs.get('limit') or PAGE_SIZE_DEFAULT
+        cursor = kwargs.get('cursor')
+        after = decode_cursor(cursor)
+        field = page_field(cursor, limit)
+        generation = local_cache.generation
+
+        local = local_cache.get(key, field)
+        if local is not None:
+            return local
+
+        # Only pages that are in Redis are kept in memory: the invalidations name Redis keys
+        async def read() -> tuple[bytes, str | None] | None:
+            body, next_cursor = await read_fields(redis, key, kind, field, next_cursor_field(field), tags=tags)
+            if body is None:
+                return None
+            page = body, next_cursor.decode('utf-8') if next_cursor else None
+            local_cache.set(key, field, page, generation)
+            return page
+
+        async def load() -> tuple[bytes, str | None]:
+            async with self.detached_repository() as repository:
+                rows = await fetch(repository, after, limit + 1)  # One extra row tells whether there is a next page
+            items = [schema.model_validate(row).model_dump() for row in rows[:limit]]
+            next_cursor = encode_cursor(items[-1]['id']) if len(rows) > limit else None
+            body = orjson.dumps(items)
+
+            if items:  # Filled before returning: workers waiting on the single-flight lock read it
+                page: dict[str, bytes | str] = {field: body}
+                if next_cursor:
+                    page[next_cursor_field(field)] = next_cursor
+                await cache_page(redis, key, page, tags=tags, ttl=expiry(kind))
+                local_cache.set(key, field, (body, next_cursor), generation)
+
+            return body, next_cursor
+
+        cached = await read()
+        cache_metrics.observe(kind, hit=cached is not None)
+
+        return cached or await single_flight.run(redis, f'{key}:{field}', read, load)
+
+    async def retrieve_body(self,
+                            build: Callable[[AbstractRepository], Awaitable[bytes]],
+                            key: str,
+                            tags: list[str],
+                            kind: str,
+                            **kwargs) -> bytes:
+        redis = kwargs['redis']
+        read = partial(read_body, redis, key, kind, tags)
+        generation = local_cache.generation
+
+        body = local_cache.get(key)
+        if body is not None:
+            return body
+
+        async def load() -> bytes:
+            async with self.detached_repository() as repository:
+                body = await build(repository)
+            await cache_body(redis, key, body, tags=tags, ttl=expiry(kind))
+            return body
+
+        cached = await read()
+        cache_metrics.observe(kind, hit=cached is not None)
+
+        body = cached or await single_flight.run(redis, key, read, load)
+        local_cache.set(key, None, body, generation)
+
+        return body
+
+    async def retrieve_one(self, pk: UUID, **kwargs) -> Row | Dish:
+        repository = kwargs.get('repository') or self.repository
+        obj = await repository.retrieve_one(pk)
 
         if not obj:
             raise self.exception
 
         return obj
 
-    async def create_and_retrieve(self, data: dict, **kwargs) -> Menu | Submenu | Dish:
-        pk = await self.repository.create(data)
-        obj = await self.repository.retrieve_one(pk)
+    async def create_and_retrieve(self, data: dict, **kwargs) -> Row:
+        obj = await self.repository.create_and_retrieve(data)
+        await self.uow.commit()
+        await self.refresh_tree_snapshot(**kwargs)
+        await expire_sync_state(kwargs['redis'])
 
         return obj
 
-    async def update_and_retrieve(self, pk: UUID, data: dict, **kwargs) -> Menu | Submenu | Dish:
-        await self.repository.update(pk, data)
-        obj = await self.repository.retrieve_one(pk)
+    async def update_and_retrieve(self, pk: UUID, data: dict, **kwargs) -> Row:
+        obj = await self.repository.update_and_retrieve(pk, data)
 
         if not obj:
             raise self.exception
 
+        await self.uow.commit()
+        await self.refresh_tree_snapshot(**kwargs)
+        await expire_sync_state(kwargs['redis'])
+
         return obj
 
     async def delete(self, pk: UUID, **kwargs) -> None:
         await self.repository.delete(pk)
-
-
-class MenuService(RestaurantService):
-    exception = NoSuchMenuError
-
-    async def retrieve_list(self, **kwargs) -> list[MenuRetrieve]:
+        await self.uow.commit()
+        await self.refresh_tree_snapshot(**kwargs)
+        await expire_sync_state(kwargs['redis'])
+
+    async def apply_batch(self,
+                          batch: dict,
+                          parent: dict,
+                          **kwargs) -> tuple[Sequence[Row], Sequence[Row], list[UUID]]:
+        created = await self.repository.bulk_create([{**data, **parent} for data in batch['create']])
+        updated = await self.repository.bulk_update(batch['update'], **parent)
+        deleted = await self.repository.bulk_delete(batch['delete'], **parent)
+        await self.uow.commit()
+        await self.refresh_tree_snapshot(**kwargs)
+        await expire_sync_state(kwargs['redis'])
+
+        return created, updated, deleted
+
+    async def refresh_tree_snapshot(self, **kwargs) -> None:
+        # Expired before the response, so the next read cannot see the old tree; rebuilt after it
         redis = kwargs['redis']
-        menus = redis.lrange('list:menu', 0, -1)
+        await expire_tree_snapshot(redis)
+        kwargs['background_tasks'].add_task(rebuild_tree_snapshot, redis, self.uow.session_maker)
 
-        if menus:
-            menus_utf8 = [menu.decode('utf-8') for menu in menus]
-            menus_retrieve = [MenuRetrieve(**json.loads(menu)) for menu in menus_utf8]
-            return menus_retrieve
+    async def retire_etags(self, versions: list[str], **kwargs) -> None:
+        # Bumped before the response for read-your-writes, and again after the background invalidation:
+        # a body read from the not yet invalidated cache in between must not keep the new tag
+        redis = kwargs['redis']
+        await bump_versions(redis, versions)
+        kwargs['background_tasks'].add_task(bump_versions, redis, versions)
 
-        menus = await super().retrieve_list()
-        menus_retrieve = [menu.to_pydantic_model() for menu in menus]
 
-        if menus_retrieve:
-            kwargs['background_tasks'].add_task(redis.lpush,
-                                                'list:menu',
-                                                *[json.dumps(menu.model_dump()) for menu in menus_retrieve])
-        return menus_retrieve
+class MenuService(RestaurantService):
+    exception = NoSuchMenuError
 
-    async def retrieve_one(self, pk: UUID, **kwargs) -> MenuRetrieve:
-        redis = kwargs['redis']
-        menu = redis.hgetall(f'{pk}::')
+    async def retrieve_list(self, **kwargs) -> tuple[bytes, str | None]:  # type: ignore
+        async def fetch(repository: MenuRepository, after: UUID | None, limit: int) -> Sequence[Row]:
+            return await repository.retrieve_list(after, limit)
 
-        if menu:
-            menu_utf8 = {k.decode('utf-8'): v.decode('utf-8') for k, v in menu.items()}
-            return MenuRetrieve(**menu_utf8)
+        return await self.retrieve_page(fetch,
+                                        MenuRetrieve,
+                                        MENU_LIST_KEY,
+                                        [],
+                                        MENU_LIST,
+                                        **kwargs)
 
-        menu = await super().retrieve_one(pk)
+    async def retrieve_one(self, pk: UUID, **kwargs) -> bytes:  # type: ignore
+        async def build(repository: AbstractRepository) -> bytes:
+            menu = await super(MenuService, self).retrieve_one(pk, repository=repository)
+            return orjson.dumps(MenuRetrieve.model_validate(menu).model_dump())
 
-        kwargs['background_tasks'].add_task(redis.hset,
-                                            name=f'{pk}::',
-                                            mapping=menu.to_pydantic_model().model_dump())
-        return menu.to_pydantic_model()
+        return await self.retrieve_body(build, menu_key(pk), [menu_tag(pk)], MENU, **kwargs)
 
     async def create_and_retrieve(self, data: dict, **kwargs) -> MenuRetrieve:
         redis = kwargs['redis']
-        menu = await super().create_and_retrieve(data)
-        kwargs['background_tasks'].add_task(redis.delete, 'list:menu')
+        menu_retrieve = MenuRetrieve.model_validate(await super().create_and_retrieve(data, **kwargs))
+
+        if self.write_through:
+            await write_through(redis,
+                                menu_key(menu_retrieve.id),
+                                orjson.dumps(menu_retrieve.model_dump()),
+                                tags=[menu_tag(menu_retrieve.id)],
+                                unlink=[MENU_LIST_KEY],
+                                ttl=expiry(MENU))
+        else:
+            kwargs['background_tasks'].add_task(invalidate, redis, keys=[MENU_LIST_KEY])
 
-        return menu.to_pydantic_model()
+        await self.retire_etags(menu_write_versions(menu_retrieve.id), **kwargs)
+
+        return menu_retrieve
 
     async def update_and_retrieve(self, pk: UUID, data: dict, **kwargs) -> MenuRetrieve:
         redis = kwargs['redis']
-        menu = await super().update_and_retrieve(pk, data)
-        kwargs['background_tasks'].add_task(redis.delete, f'{pk}::')
-        kwargs['background_tasks'].add_task(redis.delete, 'list:menu')
+        menu_retrieve = MenuRetrieve.model_validate(await super().update_and_retrieve(pk, data, **kwargs))
+
+        if self.write_through:
+            await write_through(redis,
+                                menu_key(pk),
+                                orjson.dumps(menu_retrieve.model_dump()),
+                                tags=[menu_tag(pk)],
+                                unlink=[MENU_LIST_KEY],
+                                ttl=expiry(MENU))
+        else:
+            kwargs['background_tasks'].add_task(invalidate, redis, keys=[menu_key(pk), MENU_LIST_KEY])
 
-        return menu.to_pydantic_model()
+        await self.retire_etags(menu_write_versions(pk), **kwargs)
+
+        return menu_retrieve
 
     async def delete(self, pk: UUID, **kwargs) -> None:
         redis = kwargs['redis']
-        await super().delete(pk)
-        kwargs['background_tasks'].add_task(delete_if_keys_exists, redis, 'list:*')
-        kwargs['background_tasks'].add_task(delete_if_keys_exists, redis, f'{pk}:*:*')
-
-    async def retrieve_list_with_dependencies(self) -> list[Menu]:
-        async with self.repository.session_maker() as session:  # type: ignore
-            query = get_all_data_query()
-            result = await session.execute(query)
-            menus = result.unique().scalars().all()
+        await super().delete(pk, **kwargs)
+        kwargs['background_tasks'].add_task(invalidate, redis, menu_tag(pk), keys=[MENU_LIST_KEY, menu_key(pk)])
+        await self.retire_etags(menu_write_versions(pk), **kwargs)
 
-        discounts = get_discounts()
-
-        for menu in menus:
-            for submenu in menu.submenus:
-                for dish in submenu.dishes:
-                    dish_id = str(dish.id)
-                    if str(dish_id) in discounts:
-                        price = float(dish.price)
-                        discount = int(discounts[dish_id])
-                        discount_price = price * (100 - discount) / 100
-                        dish.price = str(discount_price)
+    async def retrieve_tree_snapshot(self, **kwargs) -> tuple[bytes, str]:
+        return await get_tree_snapshot(kwargs['redis'], self.uow.session_maker)
 
-        return menus
+    def stream_list_with_dependencies(self) -> AsyncIterator[bytes]:
+        return stream_tree(self.uow.session_maker)
 
 
 class SubmenuService(RestaurantService):
     exception = NoSuchSubmenuError
 
-    async def retrieve_list_by_menu_id(self, menu_id: UUID, **kwargs) -> list[SubmenuRetrieve]:
-        redis = kwargs['redis']
-        submenus = redis.lrange('list:submenu', 0, -1)
+    async def retrieve_list_by_menu_id(self, menu_id: UUID, **kwargs) -> tuple[bytes, str | None]:
+        async def fetch(repository: SubmenuRepository, after: UUID | None, limit: int) -> Sequence[Row]:
+            return await repository.retrieve_list_by_menu_id(menu_id, after, limit)
 
-        if submenus:
-            submenus_utf8 = [submenu.decode('utf-8') for submenu in submenus]
-            submenus_retrieve = [SubmenuRetrieve(**json.loads(submenu)) for submenu in submenus_utf8]
-            return submenus_retrieve
+        return await self.retrieve_page(fetch,
+                                        SubmenuRetrieve,
+                                        submenu_list_key(menu_id),
+                                        [menu_tag(menu_id)],
+                                        SUBMENU_LIST,
+                                        **kwargs)
 
-        submenus = await self.repository.retrieve_list()
-        submenus_of_menu = [submenu for submenu in submenus if submenu.menu_id == menu_id]
-        submenus_retrieve = [submenu.to_pydantic_model() for submenu in submenus_of_menu]
+    async def retrieve_one(self, pk: UUID, **kwargs) -> bytes:  # type: ignore
+        menu_id = kwargs['menu_id']
 
-        if submenus_retrieve:
-            kwargs['background_tasks'].add_task(redis.lpush,
-                                                'list:submenu',
-                                                *[json.dumps(submenu.model_dump()) for submenu in submenus_retrieve])
+        async def build(repository: AbstractRepository) -> bytes:
+            submenu = await super(SubmenuService, self).retrieve_one(pk, repository=repository)
+            return orjson.dumps(SubmenuRetrieve.model_validate(submenu).model_dump())
 
-        return submenus_retrieve
+        return await self.retrieve_body(build,
+                                        submenu_key(menu_id, pk),
+                                        [menu_tag(menu_id), submenu_tag(menu_id, pk)],
+                                        SUBMENU,
+                                        **kwargs)
 
-    async def retrieve_one(self, pk: UUID, **kwargs) -> SubmenuRetrieve:
+    async def create_and_retrieve(self, data: dict, **kwargs) -> SubmenuRetrieve:
         redis = kwargs['redis']
+        submenu_retrieve = SubmenuRetrieve.model_validate(await super().create_and_retrieve(data, **kwargs))
         menu_id = kwargs['menu_id']
-        submenu = redis.hgetall(f'{menu_id}:{pk}:')
-
-        if submenu:
-            submenu_utf8 = {k.decode('utf-8'): v.decode('utf-8') for k, v in submenu.items()}
-            return SubmenuRetrieve(**submenu_utf8)
 
-        submenu = await super().retrieve_one(pk)
+        if self.write_through:
+            await write_through(redis,
+                                submenu_key(menu_id, submenu_retrieve.id),
+                                orjson.dumps(submenu_retrieve.model_dump()),
+                                tags=[menu_tag(menu_id), submenu_tag(menu_id, submenu_retrieve.id)],
+                                counters=[(menu_key(menu_id), 'submenus_count', 1)],
+                                unlink=[MENU_LIST_KEY, submenu_list_key(menu_id)],
+                                ttl=expiry(SUBMENU))
+        else:
+            kwargs['background_tasks'].add_task(invalidate,
+                                                redis,
+                                                keys=[MENU_LIST_KEY,
+                                                      submenu_list_key(menu_id),
+                                                      menu_key(menu_id)])
 
-        kwargs['background_tasks'].add_task(redis.hset,
-                                            name=f'{menu_id}:{pk}:',
-                                            mapping=submenu.to_pydantic_model().model_dump())
+        await self.retire_etags(submenu_write_versions(menu_id, submenu_retrieve.id), **kwargs)
 
-        return submenu.to_pydantic_model()
+        return submenu_retrieve
 
-    async def create_and_retrieve(self, data: dict, **kwargs) -> SubmenuRetrieve:
+    async def update_and_retrieve(self, pk: UUID, data: dict, **kwargs) -> SubmenuRetrieve:
         redis = kwargs['redis']
-        submenu = await super().create_and_retrieve(data)
+        submenu_retrieve = SubmenuRetrieve.model_validate(await super().update_and_retrieve(pk, data, **kwargs))
         menu_id = kwargs['menu_id']
 
-        kwargs['background_tasks'].add_task(redis.delete, 'list:menu')
-        kwargs['background_tasks'].add_task(redis.delete, 'list:submenu')
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}::')
+        if self.write_through:
+            await write_through(redis,
+                                submenu_key(menu_id, pk),
+                                orjson.dumps(submenu_retrieve.model_dump()),
+                                tags=[menu_tag(menu_id), submenu_tag(menu_id, pk)],
+                                unlink=[submenu_list_key(menu_id)],
+                                ttl=expiry(SUBMENU))
+        else:
+            kwargs['background_tasks'].add_task(invalidate,
+                                                redis,
+                                                keys=[submenu_key(menu_id, pk),
+                                                      submenu_list_key(menu_id)])
+
+        await self.retire_etags(submenu_write_versions(menu_id, pk), **kwargs)
 
-        return submenu.to_pydantic_model()
+        return submenu_retrieve
 
-    async def update_and_retrieve(self, pk: UUID, data: dict, **kwargs) -> SubmenuRetrieve:
+    async def delete(self, pk: UUID, **kwargs) -> None:
         redis = kwargs['redis']
-        submenu = await super().update_and_retrieve(pk, data)
+        await super().delete(pk, **kwargs)
         menu_id = kwargs['menu_id']
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}:{pk}:')
-        kwargs['background_tasks'].add_task(redis.delete, 'list:submenu')
 
-        return submenu.to_pydantic_model()
+        kwargs['background_tasks'].add_task(invalidate,
+                                            redis,
+                                            submenu_tag(menu_id, pk),
+                                            keys=[MENU_LIST_KEY,
+                                                  submenu_list_key(menu_id),
+                                                  menu_key(menu_id),
+                                                  submenu_key(menu_id, pk)])
+        await self.retire_etags(submenu_write_versions(menu_id, pk), **kwargs)
 
-    async def delete(self, pk: UUID, **kwargs) -> None:
+    async def apply_batch(self, batch: dict, **kwargs) -> SubmenuBatchResult:  # type: ignore
         redis = kwargs['redis']
-        await super().delete(pk)
         menu_id = kwargs['menu_id']
+        created, updated, deleted = await super().apply_batch(batch, {'menu_id': menu_id}, **kwargs)
 
-        kwargs['background_tasks'].add_task(delete_if_keys_exists, redis, 'list:*')
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}::')
-        kwargs['background_tasks'].add_task(delete_if_keys_exists, redis, f'{menu_id}:{pk}:*')
+        # One invalidation for the whole batch: the menu's index set holds every key cached below it
+        kwargs['background_tasks'].add_task(invalidate,
+                                            redis,
+                                            menu_tag(menu_id),
+                                            keys=[MENU_LIST_KEY, menu_key(menu_id)])
+        submenu_ids = [row.id for row in (*created, *updated)] + deleted
+        await self.retire_etags(submenu_write_versions(menu_id, *submenu_ids), **kwargs)
+
+        return SubmenuBatchResult(created=[SubmenuRetrieve.model_validate(row) for row in created],
+                                  updated=[SubmenuRetrieve.model_validate(row) for row in updated],
+                                  deleted=[str(pk) for pk in deleted])
 
 
 class DishService(RestaurantService):
     exception = NoSuchDishError
 
-    async def retrieve_list_by_submenu_id(self, submenu_id: UUID, **kwargs) -> list[DishRetrieve]:
-        redis = kwargs['redis']
-        dishes = redis.lrange('list:dish', 0, -1)
-
-        if dishes:
-            dishes_utf8 = [dish.decode('utf-8') for dish in dishes]
-            dishes_retrieve = [DishRetrieve(**json.loads(dish)) for dish in dishes_utf8]
-        else:
-            dishes = await self.repository.retrieve_list()
-            dishes = [dish for dish in dishes if dish.submenu_id == submenu_id]
-            dishes_retrieve = [dish.to_pydantic_model() for dish in dishes]
-
-            if dishes_retrieve:
-                kwargs['background_tasks'].add_task(redis.lpush,
-                                                    'list:dish',
-                                                    *[json.dumps(dish.model_dump()) for dish in dishes_retrieve])
-        if dishes_retrieve:
-            discounts = get_discounts()
-            for dish_retrieve in dishes_retrieve:
-                if dish_retrieve.id in discounts:
-                    price = float(dish_retrieve.price)
-                    discount = int(discounts[dish_retrieve.id])
-                    discount_price = price * (100 - discount) / 100
-                    dish_retrieve.price = str(discount_price)
-
-        return dishes_retrieve
-
-    async def retrieve_one(self, pk: UUID, **kwargs) -> DishRetrieve:
-        redis = kwargs['redis']
+    async def retrieve_list_by_submenu_id(self,
+                                          submenu_id: UUID,
+                                          **kwargs) -> tuple[bytes, str | None]:
         menu_id = kwargs['menu_id']
-        submenu_id = kwargs['submenu_id']
+        discounts = get_discounts()
 
-        dish = redis.hgetall(f'{menu_id}:{submenu_id}:{pk}')
+        async def fetch(repository: DishRepository, after: UUID | None, limit: int) -> Sequence[Row]:
+            return await repository.retrieve_list_by_submenu_id(submenu_id, after, limit, discounts=discounts)
 
-        if dish:
-            dish_utf8 = {k.decode('utf-8'): v.decode('utf-8') for k, v in dish.items()}
-            dish_retrieve = DishRetrieve(**dish_utf8)
-        else:
-            dish = await super().retrieve_one(pk)
+        body, next_cursor = await self.retrieve_page(
+            fetch,
+            DishRetrieve,
+            dish_list_key(menu_id, submenu_id),
+            [menu_tag(menu_id), submenu_tag(menu_id, submenu_id)],
+            DISH_LIST,
+            **kwargs
+        )
 
-            kwargs['background_tasks'].add_task(redis.hset,
-                                                name=f'{menu_id}:{submenu_id}:{pk}',
-                                                mapping=dish.to_pydantic_model().model_dump())
+        return body, next_cursor
 
-            dish_retrieve = dish.to_pydantic_model()
+    async def retrieve_one(self, pk: UUID, **kwargs) -> bytes:  # type: ignore
+        menu_id = kwargs['menu_id']
+        submenu_id = kwargs['submenu_id']
 
-        discounts = get_discounts()
+        async def build(repository: AbstractRepository) -> bytes:
+            dish = await super(DishService, self).retrieve_one(pk, repository=repository)
+            return orjson.dumps(self.finalize(dish.to_pydantic_model().model_dump()))
 
-        if dish_retrieve.id in discounts:
-            price = float(dish_retrieve.price)
-            discount = int(discounts[dish_retrieve.id])
-            discount_price = price * (100 - discount) / 100
-            dish_retrieve.price = str(discount_price)
+        return await self.retrieve_body(build,
+                                        dish_key(menu_id, submenu_id, pk),
+                                        [menu_tag(menu_id), submenu_tag(menu_id, submenu_id)],
+                                        DISH,
+                                        **kwargs)
 
-        return dish_retrieve
+    def finalize(self, dish: dict) -> dict:
+        # Prices are cached discounted (listings are discounted in the query); the sync drops the entries
+        # of dishes whose discount changes
+        discounts = get_discounts()
+        if dish['id'] in discounts:
+            dish['price'] = apply_discount(dish['price'], discounts[dish['id']])
+        return dish
 
     async def create_and_retrieve(self, data: dict, **kwargs) -> DishRetrieve:
         redis = kwargs['redis']
         menu_id = kwargs['menu_id']
         submenu_id = kwargs['submenu_id']
 
-        dish = await super().create_and_retrieve(data)
-
-        kwargs['background_tasks'].add_task(delete_if_keys_exists, redis, 'list:*')
+        dish_retrieve = DishRetrieve.model_validate(await super().create_and_retrieve(data, **kwargs))
+
+        if self.write_through:
+            await write_through(redis,
+                                dish_key(menu_id, submenu_id, dish_retrieve.id),
+                                orjson.dumps(self.finalize(dish_retrieve.model_dump())),
+                                tags=[menu_tag(menu_id), submenu_tag(menu_id, submenu_id)],
+                                counters=[(menu_key(menu_id), 'dishes_count', 1),
+                                          (submenu_key(menu_id, submenu_id), 'dishes_count', 1)],
+                                unlink=[MENU_LIST_KEY, submenu_list_key(menu_id), dish_list_key(menu_id, submenu_id)],
+                                ttl=expiry(DISH))
+        else:
+            kwargs['background_tasks'].add_task(invalidate,
+                                                redis,
+                                                keys=[MENU_LIST_KEY,
+                                                      submenu_list_key(menu_id),
+                                                      dish_list_key(menu_id, submenu_id),
+                                                      menu_key(menu_id),
+                                                      submenu_key(menu_id, submenu_id)])
 
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}::')
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}:{submenu_id}:')
+        await self.retire_etags(dish_write_versions(menu_id, submenu_id, dish_retrieve.id), **kwargs)
 
-        return dish.to_pydantic_model()
+        return dish_retrieve
 
     async def update_and_retrieve(self, pk: UUID, data: dict, **kwargs) -> DishRetrieve:
         redis = kwargs['redis']
         menu_id = kwargs['menu_id']
         submenu_id = kwargs['submenu_id']
 
-        dish = await super().update_and_retrieve(pk, data)
+        dish_retrieve = DishRetrieve.model_validate(await super().update_and_retrieve(pk, data, **kwargs))
+
+        if self.write_through:
+            await write_through(redis,
+                                dish_key(menu_id, submenu_id, pk),
+                                orjson.dumps(self.finalize(dish_retrieve.model_dump())),
+                                tags=[menu_tag(menu_id), submenu_tag(menu_id, submenu_id)],
+                                unlink=[dish_list_key(menu_id, submenu_id)],
+                                ttl=expiry(DISH))
+        else:
+            kwargs['background_tasks'].add_task(invalidate,
+                                                redis,
+                                                keys=[dish_key(menu_id, submenu_id, pk),
+                                                      dish_list_key(menu_id, submenu_id)])
 
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}:{submenu_id}:{pk}')
-        kwargs['background_tasks'].add_task(redis.delete, 'list:dish')
+        await self.retire_etags(dish_write_versions(menu_id, submenu_id, pk), **kwargs)
 
-        return dish.to_pydantic_model()
+        return dish_retrieve
 
     async def delete(self, pk: UUID, **kwargs) -> None:
         redis = kwargs['redis']
         menu_id = kwargs['menu_id']
         submenu_id = kwargs['submenu_id']
 
-        await super().delete(pk)
+        await super().delete(pk, **kwargs)
 
-        kwargs['background_tasks'].add_task(delete_if_keys_exists, redis, 'list:*')
+        kwargs['background_tasks'].add_task(invalidate,
+                                            redis,
+                                            keys=[MENU_LIST_KEY,
+                                                  submenu_list_key(menu_id),
+                                                  dish_list_key(menu_id, submenu_id),
+                                                  menu_key(menu_id),
+                                                  submenu_key(menu_id, submenu_id),
+                                                  dish_key(menu_id, submenu_id, pk)])
+        await self.retire_etags(dish_write_versions(menu_id, submenu_id, pk), **kwargs)
 
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}::')
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}:{submenu_id}:')
-        kwargs['background_tasks'].add_task(redis.delete, f'{menu_id}:{submenu_id}:{pk}')
+    async def apply_batch(self, batch: dict, **kwargs) -> DishBatchResult:  # type: ignore
+        redis = kwargs['redis']
+        menu_id = kwargs['menu_id']
+        submenu_id = kwargs['submenu_id']
+        created, updated, deleted = await super().apply_batch(batch, {'submenu_id': submenu_id}, **kwargs)
+
+        # One invalidation for the whole batch: the submenu's index set holds every dish key cached below it
+        kwargs['background_tasks'].add_task(invalidate,
+                                            redis,
+                                            submenu_tag(menu_id, submenu_id),
+                                            keys=[MENU_LIST_KEY,
+                                                  submenu_list_key(menu_id),
+                                                  menu_key(menu_id),
+                                                  submenu_key(menu_id, submenu_id)])
+        dish_ids = [row.id for row in (*created, *updated)] + deleted
+        await self.retire_etags(dish_write_versions(menu_id, submenu_id, *dish_ids), **kwargs)
+
+        return DishBatchResult(created=[DishRetrieve.model_validate(row) for row in created],
+                               updated=[DishRetrieve.model_validate(row) for row in updated],
+                               deleted=[str(pk) for pk in deleted])
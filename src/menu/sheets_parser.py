@@ -1,10 +1,73 @@
+from collections.abc import Iterator
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
 import openpyxl
 
+WORKBOOK_PATH = 'admin/MenuSheets.xlsx'
+ROW_WIDTH = 7  # menu id | submenu id | dish id | title | description | price | discount
+
+
+@dataclass(slots=True)
+class MenuRow:
+    id: str
+    title: str
+    description: str
+
+
+@dataclass(slots=True)
+class SubmenuRow:
+    id: str
+    title: str
+    description: str
+    menu_id: str
+
+
+@dataclass(slots=True)
+class DishRow:
+    id: str
+    title: str
+    description: str
+    price: Decimal
+    discount: str | None
+    submenu_id: str
+
+
+SheetRow = MenuRow | SubmenuRow | DishRow
+
+
+def iter_rows(path: str = WORKBOOK_PATH) -> Iterator[SheetRow]:
+    # A row belongs to the closest row above it one level up, a row without one is an error of the workbook
+    book = openpyxl.load_workbook(path, read_only=True)
+    current_menu: str | None = None
+    current_submenu: str | None = None
 
-def get_rows() -> list[list[str]]:
-    book = openpyxl.load_workbook('admin/MenuSheets.xlsx', read_only=True)
-    sheet = book.active
-    values = [[e for e in row] for row in sheet.values]
-    book.close()
+    try:
+        for number, values in enumerate(book.active.iter_rows(values_only=True), start=1):
+            row = (*values, *(None,) * (ROW_WIDTH - len(values)))
 
-    return values
+            if row[0]:
+                current_menu, current_submenu = row[0], None
+                yield MenuRow(id=row[0], title=row[1], description=row[2])
+            elif row[1]:
+                if current_menu is None:
+                    raise ValueError(f'{path}, row {number}: submenu {row[1]} is not below a menu')
+                current_submenu = row[1]
+                yield SubmenuRow(id=row[1], title=row[2], description=row[3], menu_id=current_menu)
+            elif row[2]:
+                if current_submenu is None:
+                    raise ValueError(f'{path}, row {number}: dish {row[2]} is not below a submenu')
+                try:
+                    price = Decimal(str(row[5]))
+                    if not price.is_finite():  # 'nan' and 'inf' cells
+                        raise InvalidOperation
+                except InvalidOperation:
+                    raise ValueError(f'{path}, row {number}: dish {row[2]} has no valid price ({row[5]!r})') from None
+                yield DishRow(id=row[2],
+                              title=row[3],
+                              description=row[4],
+                              price=price,
+                              discount=str(row[6]) if row[6] else None,
+                              submenu_id=current_submenu)
+    finally:
+        book.close()
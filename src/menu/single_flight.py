@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+from uuid import uuid4
+
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError, TimeoutError
+
+from src.config import CACHE_LOCK_TIMEOUT_MS
+
+logger = logging.getLogger(__name__)
+
+# Released locks are announced here, the worker waiting on one retries at once
+LOCK_RELEASED_CHANNEL = 'cache:lock-released'
+
+# Deletes the lock only while it still holds our token: a leader that outlived its lock must not release the next one
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('PUBLISH', ARGV[2], KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class SingleFlightMetrics:
+
+    def __init__(self):
+        self.loads = 0
+        self.coalesced_local = 0
+        self.coalesced_remote = 0
+        self.lock_timeouts = 0
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            'loads': self.loads,
+            'coalesced': self.coalesced_local + self.coalesced_remote,
+            'coalesced_local': self.coalesced_local,
+            'coalesced_remote': self.coalesced_remote,
+            'lock_timeouts': self.lock_timeouts,
+        }
+
+
+class SingleFlight:
+    # Concurrent misses of one key are recomputed once: requests of this process share one task, and the
+    # processes take a short Redis lock, so that only its holder runs the query while the others wait for the fill.
+    # `load` must fill the cache before it returns, `read` returns None on a miss.
+
+    def __init__(self, lock_timeout_ms: int = CACHE_LOCK_TIMEOUT_MS):
+        self.lock_timeout_ms = lock_timeout_ms
+        self.metrics = SingleFlightMetrics()
+        self._flights: dict[str, asyncio.Future] = {}
+        self._releases: dict[str, asyncio.Future] = {}
+
+    async def run(self,
+                  redis: Redis,
+                  key: str,
+                  read: Callable[[], Awaitable[Any]],
+                  load: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+
+        if flight is None:
+            flight = asyncio.ensure_future(self._run_locked(redis, key, read, load))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.metrics.coalesced_local += 1
+
+        # Shielded: a cancelled request must not cancel the load the other requests are waiting for
+        return await asyncio.shield(flight)
+
+    async def _run_locked(self,
+                          redis: Redis,
+                          key: str,
+                          read: Callable[[], Awaitable[Any]],
+                          load: Callable[[], Awaitable[Any]]) -> Any:
+        lock = f'lock:{key}'
+        token = uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_timeout_ms / 1000
+
+        while True:
+            # Registered before the lock is tried, so a release right after the failed SET still wakes us
+            released = self._releases[lock] = loop.create_future()
+            try:
+                if await redis.set(lock, token, nx=True, px=self.lock_timeout_ms):
+                    break
+
+                value = await read()
+                if value is not None:
+                    self.metrics.coalesced_remote += 1
+                    return value
+
+                if loop.time() >= deadline:  # The holder is stuck or gone, do not wait any longer
+                    self.metrics.lock_timeouts += 1
+                    self.metrics.loads += 1
+                    return await load()
+
+                await asyncio.wait([released], timeout=deadline - loop.time())
+            finally:
+                if self._releases.get(lock) is released:
+                    del self._releases[lock]
+
+        try:
+            value = await read()  # Filled by another worker between our miss and the lock, or while we waited
+            if value is not None:
+                self.metrics.coalesced_remote += 1
+                return value
+
+            self.metrics.loads += 1
+            return await load()
+        finally:
+            await redis.eval(RELEASE_LOCK, 1, lock, token, LOCK_RELEASED_CHANNEL)
+
+    async def watch_releases(self, redis: Redis) -> None:
+        while True:
+            try:
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(LOCK_RELEASED_CHANNEL)
+                    self._wake(*self._releases)  # Whatever was released while we were not subscribed is lost
+
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self._wake(message['data'].decode('utf-8'))
+            except (ConnectionError, TimeoutError):
+                self._wake(*self._releases)
+                logger.warning('Lost the lock release channel, resubscribing')
+                await asyncio.sleep(1)
+
+    def _wake(self, *locks: str) -> None:
+        for lock in locks:
+            released = self._releases.get(lock)
+            if released is not None and not released.done():
+                released.set_result(None)
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,92 @@
+import json
+from typing import AsyncIterator
+
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config import STREAM_BATCH_SIZE
+from src.unit_of_work import UnitOfWork
+
+from .crud import get_all_data_flat_query
+from .etags import compute_etag
+from .redis_utils import (
+    TREE_GENERATION_KEY,
+    TREE_SNAPSHOT_KEY,
+    expire_tree_snapshot,
+    store_tree_snapshot,
+)
+from .utils import get_discounts
+
+
+async def stream_tree(session_maker: async_sessionmaker[AsyncSession]) -> AsyncIterator[bytes]:
+    # Holds its own session: a streaming response outlives the request's unit of work
+    query = get_all_data_flat_query(get_discounts()).execution_options(yield_per=STREAM_BATCH_SIZE)
+    buffer = ['[']
+    current_menu = current_submenu = None
+    dishes_in_submenu = 0
+
+    async with UnitOfWork(session_maker) as uow:
+        result = await uow.session.stream(query)
+
+        async for (menu_id, menu_title, menu_desc,
+                   submenu_id, submenu_title, submenu_desc,
+                   dish_id, dish_title, dish_desc, dish_price) in result:
+            if menu_id != current_menu:
+                if current_menu is not None:
+                    buffer.append(']}]},' if current_submenu is not None else ']},')
+                menu = {'id': str(menu_id), 'title': menu_title, 'description': menu_desc}
+                buffer.append(json.dumps(menu)[:-1] + ', "submenus": [')
+                current_menu, current_submenu = menu_id, None
+
+            if submenu_id is not None and submenu_id != current_submenu:
+                if current_submenu is not None:
+                    buffer.append(']},')
+                submenu = {'id': str(submenu_id),
+                           'title': submenu_title,
+                           'description': submenu_desc,
+                           'menu_id': str(menu_id)}
+                buffer.append(json.dumps(submenu)[:-1] + ', "dishes": [')
+                current_submenu, dishes_in_submenu = submenu_id, 0
+
+            if dish_id is not None:
+                dish = {'id': str(dish_id),
+                        'title': dish_title,
+                        'description': dish_desc,
+                        'price': f'{dish_price:.2f}',
+                        'submenu_id': str(submenu_id)}
+                buffer.append((',' if dishes_in_submenu else '') + json.dumps(dish))
+                dishes_in_submenu += 1
+
+            if len(buffer) >= STREAM_BATCH_SIZE:
+                yield ''.join(buffer).encode('utf-8')
+                buffer = []
+
+    if current_menu is not None:
+        buffer.append(']}]}' if current_submenu is not None else ']}')
+    buffer.append(']')
+
+    yield ''.join(buffer).encode('utf-8')
+
+
+async def rebuild_tree_snapshot(redis: Redis, session_maker: async_sessionmaker[AsyncSession]) -> tuple[bytes, str]:
+    generation = await redis.get(TREE_GENERATION_KEY)  # Read before the db, so concurrent writes win
+    body = b''.join([chunk async for chunk in stream_tree(session_maker)])
+    etag = compute_etag(body)
+
+    await store_tree_snapshot(redis, generation, body, etag)
+
+    return body, etag
+
+
+async def refresh_tree_snapshot(redis: Redis, session_maker: async_sessionmaker[AsyncSession]) -> None:
+    await expire_tree_snapshot(redis)
+    await rebuild_tree_snapshot(redis, session_maker)
+
+
+async def get_tree_snapshot(redis: Redis, session_maker: async_sessionmaker[AsyncSession]) -> tuple[bytes, str]:
+    body, etag = await redis.hmget(TREE_SNAPSHOT_KEY, 'body', 'etag')
+
+    if body is not None and etag is not None:
+        return body, etag.decode('utf-8')
+
+    return await rebuild_tree_snapshot(redis, session_maker)
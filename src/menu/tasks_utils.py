@@ -1,191 +1,345 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import typing
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import contextmanager
 from uuid import UUID
 
-from redis import Redis
-from sqlalchemy import delete, insert, select, update
+from redis.asyncio import Redis
+from sqlalchemy import any_, bindparam, cast, delete, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, OID, REGCLASS
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from ..database import async_session
 from .models import Dish, Menu, Submenu
-from .redis_utils import delete_if_keys_exists
+from .redis_utils import (
+    MENU_LIST_KEY,
+    SYNC_DISCOUNTS_KEY,
+    SYNC_FINGERPRINT_KEY,
+    SYNC_KEYS,
+    SYNC_ROWS_KEYS,
+    SYNC_STAT_KEY,
+    SYNC_TABLES_KEY,
+    dish_key,
+    dish_list_key,
+    invalidate,
+    menu_key,
+    menu_tag,
+    submenu_key,
+    submenu_list_key,
+    submenu_tag,
+)
+from .sheets_parser import WORKBOOK_PATH, MenuRow, SheetRow, SubmenuRow, iter_rows
+from .snapshot import refresh_tree_snapshot
+from .versions import renew_epoch
 
+logger = logging.getLogger(__name__)
 
-async def synchronize(values: list[list], redis: Redis) -> None:
+UPSERT_CHUNK_SIZE = 1000  # Keeps each statement well below the asyncpg limit of 32767 bind parameters
+
+PARENT_FIELDS = (None, 'menu_id', 'submenu_id')
+
+
+class SyncDiff:
+
+    def __init__(self):
+        self.upserts: dict[type, list[dict]] = {Menu: [], Submenu: [], Dish: []}
+        self.deletions: dict[type, list[UUID]] = {Menu: [], Submenu: [], Dish: []}
+        self.tags: set[str] = set()
+        self.keys: set[str] = set()
+
+    def __bool__(self) -> bool:
+        return any(self.upserts.values()) or any(self.deletions.values())
+
+
+@contextmanager
+def _phase(timings: dict[str, float], name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+
+
+def collect_from_document(rows: Iterable[SheetRow]) -> tuple[tuple[dict, dict, dict], dict[str, str]]:
+    # One pass over the rows, the workbook is streamed and read once per synchronization
     s_menus = {}
     s_submenus = {}
     s_dishes = {}
-    current_menu = None
-    current_submenu = None
-
-    # Collect menus, submenus and dishes from document
-    for row in values:
-        start_index = 4  # Any number > 3 to avoid all checks
-        if any(row):
-            for i in range(len(row)):
-                if row[i]:
-                    start_index = i
-                    break
-
-        if start_index < 1:  # then it's menu
-            [s_id, s_title, s_desc] = row[:3]
-            s_menus[s_id] = {'title': s_title, 'description': s_desc}
-            current_menu = s_id
-        elif start_index < 2:  # then it's submenu
-            [_, s_id, s_title, s_desc] = row[:4]
-            s_submenus[s_id] = {'title': s_title, 'description': s_desc, 'menu_id': current_menu}
-            current_submenu = s_id
-        elif start_index < 3:  # then it's dish
-            [_, _, s_id, s_title, s_desc, s_price] = row[:6]
-            s_dishes[s_id] = {
-                'title': s_title,
-                'description': s_desc,
-                'submenu_id': current_submenu,
-                'price': str(s_price)
+    discounts = {}
+
+    for row in rows:
+        if isinstance(row, MenuRow):
+            s_menus[row.id] = {'title': row.title, 'description': row.description}
+        elif isinstance(row, SubmenuRow):
+            s_submenus[row.id] = {'title': row.title, 'description': row.description, 'menu_id': row.menu_id}
+        else:
+            s_dishes[row.id] = {
+                'title': row.title,
+                'description': row.description,
+                'submenu_id': row.submenu_id,
+                'price': row.price
             }
+            if row.discount:
+                discounts[row.id] = row.discount
+
+    return (s_menus, s_submenus, s_dishes), discounts
+
+
+async def collect_from_db(session_maker: async_sessionmaker[AsyncSession] = async_session) -> tuple[dict, dict, dict]:
+    async with session_maker() as session:
+        menus = await session.execute(select(Menu.id, Menu.title, Menu.description))
+        submenus = await session.execute(select(Submenu.id, Submenu.title, Submenu.description, Submenu.menu_id))
+        dishes = await session.execute(select(Dish.id, Dish.title, Dish.description, Dish.submenu_id, Dish.price))
+
+        db_menus = {str(pk): {'title': title, 'description': desc}
+                    for pk, title, desc in menus}
+        db_submenus = {str(pk): {'title': title, 'description': desc, 'menu_id': str(menu_id)}
+                       for pk, title, desc, menu_id in submenus}
+        db_dishes = {str(pk): {'title': title, 'description': desc, 'submenu_id': str(submenu_id), 'price': price}
+                     for pk, title, desc, submenu_id, price in dishes}
+
+    return db_menus, db_submenus, db_dishes
+
+
+def row_states(entities: dict, parent_field: str | None) -> dict[str, str]:
+    # '<parent id>:<row digest>', the parent is kept to invalidate the right cache keys when the row goes away
+    return {pk: '{}:{}'.format(data[parent_field] if parent_field else '',
+                               hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest())
+            for pk, data in entities.items()}
+
+
+def select_changed(document: tuple[dict, dict, dict],
+                   stored: tuple[dict, dict, dict]) -> tuple[tuple[dict, dict, dict], tuple[dict, dict, dict]]:
+    changed_document = []
+    previous = []
+
+    for entities, stored_states, parent_field in zip(document, stored, PARENT_FIELDS):
+        states = row_states(entities, parent_field)
+        changed_document.append({pk: entities[pk] for pk, state in states.items()
+                                 if stored_states.get(pk) != state})
+        previous.append({pk: {parent_field: state.split(':', 1)[0]} if parent_field else {}
+                         for pk, state in stored_states.items()
+                         if states.get(pk) != state})
+
+    return tuple(changed_document), tuple(previous)  # type: ignore
+
+
+async def tables_identity(session_maker: async_sessionmaker[AsyncSession] = async_session) -> str:
+    # The oids of the tables change whenever they are recreated, and the stored state with them is void
+    async with session_maker() as session:
+        oids = [cast(cast(literal(model.__tablename__), REGCLASS), OID) for model in (Menu, Submenu, Dish)]
+        return (await session.execute(select(func.concat_ws(':', *oids)))).scalar_one()
+
+
+async def load_stored_states(redis: Redis) -> tuple[dict, dict, dict]:
+    async with redis.pipeline(transaction=False) as pipe:
+        for key in SYNC_ROWS_KEYS:
+            pipe.hgetall(key)
+        results = await pipe.execute()
+
+    return tuple({k.decode('utf-8'): v.decode('utf-8') for k, v in result.items()}  # type: ignore
+                 for result in results)
+
+
+async def save_stored_states(redis: Redis, document: tuple[dict, dict, dict], tables: str) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(SYNC_TABLES_KEY, tables)
+        for key, entities, parent_field in zip(SYNC_ROWS_KEYS, document, PARENT_FIELDS):
+            pipe.delete(key)
+            if entities:
+                pipe.hset(key, mapping=typing.cast(Mapping[str | bytes, str], row_states(entities, parent_field)))
+        await pipe.execute()
+
+
+async def load_stored_discounts(redis: Redis) -> dict[str, str]:
+    return {k.decode('utf-8'): v.decode('utf-8') for k, v in (await redis.hgetall(SYNC_DISCOUNTS_KEY)).items()}
+
+
+async def save_stored_discounts(redis: Redis, discounts: dict[str, str]) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(SYNC_DISCOUNTS_KEY)
+        if discounts:
+            pipe.hset(SYNC_DISCOUNTS_KEY, mapping=typing.cast(Mapping[str | bytes, str], discounts))
+        await pipe.execute()
+
+
+def discount_keys(document: tuple[dict, dict, dict], previous: dict[str, str], current: dict[str, str]) -> set[str]:
+    # Cached dish bodies carry the final price, so only dishes whose discount changed are dropped
+    _, s_submenus, s_dishes = document
+    keys: set[str] = set()
 
-    # Get menus from db
-    async with async_session() as session:
-        result = await session.execute(select(Menu))
-        menus = result.scalars().all()
-
-    # Sync menus existing in db
-    for menu in menus:
-        uuid = str(menu.id)
-        if uuid not in s_menus:
-            async with async_session() as session:
-                await session.execute(delete(Menu).where(Menu.id == UUID(uuid)))
-                await session.commit()
-
-            delete_if_keys_exists(redis, 'list:*')
-            delete_if_keys_exists(redis, f'{uuid}:*:*')
+    for pk in previous.keys() | current.keys():
+        if previous.get(pk) == current.get(pk) or pk not in s_dishes:  # Removed dishes are left to the diff
             continue
+        submenu_id = s_dishes[pk]['submenu_id']
+        menu_id = s_submenus.get(submenu_id, {}).get('menu_id')
+        keys.update((dish_list_key(menu_id, submenu_id), dish_key(menu_id, submenu_id, pk)))
 
-        elif not {
-            'title': menu.title,
-            'description': menu.description
-        } == s_menus[uuid]:
-            new_title, new_desc = s_menus[uuid]['title'], s_menus[uuid]['description']
-            async with async_session() as session:
-                await session.execute(update(Menu)
-                                      .where(Menu.id == UUID(uuid))
-                                      .values(title=new_title, description=new_desc))
-                await session.commit()
+    return keys
 
-            delete_if_keys_exists(redis, 'list:menu')
-            delete_if_keys_exists(redis, f'{uuid}::')
 
-        del s_menus[uuid]
+def compute_diff(document: tuple[dict, dict, dict],
+                 db: tuple[dict, dict, dict],
+                 menu_of_submenu: dict[str, str] | None = None) -> SyncDiff:
+    s_menus, s_submenus, s_dishes = document
+    db_menus, db_submenus, db_dishes = db
+    diff = SyncDiff()
 
-    # Add new menus from document to db
+    menu_of_submenu = dict(menu_of_submenu or {})
+    menu_of_submenu.update({pk: data['menu_id'] for pk, data in db_submenus.items() if 'menu_id' in data})
+    menu_of_submenu.update({pk: data['menu_id'] for pk, data in s_submenus.items()})
+
+    def submenu_keys(menu_id: str, submenu_id: str) -> list[str]:
+        return [MENU_LIST_KEY, submenu_list_key(menu_id), menu_key(menu_id), submenu_key(menu_id, submenu_id)]
+
+    def dish_keys(submenu_id: str, pk: str) -> list[str]:
+        # The submenu of a dish is always in the document, the db or the stored state
+        menu_id = menu_of_submenu[submenu_id]
+        return [*submenu_keys(menu_id, submenu_id),
+                dish_list_key(menu_id, submenu_id),
+                dish_key(menu_id, submenu_id, pk)]
+
+    # Menus
     for pk, data in s_menus.items():
-        async with async_session() as session:
-            await session.execute(insert(Menu).values(id=UUID(pk),
-                                                      title=data['title'],
-                                                      description=data['description']))
-            await session.commit()
-
-        redis.delete('list:menu')
-
-    # Get submenus from db
-    async with async_session() as session:
-        result = await session.execute(select(Submenu))
-        submenus = result.scalars().all()
-
-    # Sync submenus
-    for submenu in submenus:
-        uuid = str(submenu.id)
-        if uuid not in s_submenus:
-            async with async_session() as session:
-                await session.execute(delete(Submenu).where(Submenu.id == UUID(uuid)))
-                await session.commit()
-
-            redis.delete(f'{submenu.menu_id}::')
-            delete_if_keys_exists(redis, 'list:*')
-            delete_if_keys_exists(redis, f'{submenu.menu_id}:{uuid}:*')
-            continue
-        elif not {
-            'title': submenu.title,
-            'description': submenu.description,
-            'menu_id': submenu.menu_id
-        } == s_submenus[uuid]:
-            new_title, new_desc, new_menu_id = (s_submenus[uuid]['title'],
-                                                s_submenus[uuid]['description'],
-                                                s_submenus[uuid]['menu_id'])
-            async with async_session() as session:
-                await session.execute(update(Submenu)
-                                      .where(Submenu.id == UUID(uuid))
-                                      .values(title=new_title,
-                                              description=new_desc,
-                                              menu_id=new_menu_id))
-                await session.commit()
-
-            redis.delete(f'{submenu.menu_id}:{uuid}:')
-            redis.delete('list:submenu')
-
-        del s_submenus[uuid]
-
-    # Add new submenus from document to db
+        if db_menus.get(pk) != data:
+            diff.upserts[Menu].append({'id': UUID(pk), **data})
+            diff.keys.update((MENU_LIST_KEY, menu_key(pk)))
+
+    for pk in db_menus.keys() - s_menus.keys():
+        diff.deletions[Menu].append(UUID(pk))
+        diff.tags.add(menu_tag(pk))
+        diff.keys.update((MENU_LIST_KEY, menu_key(pk)))
+
+    # Submenus
     for pk, data in s_submenus.items():
-        async with async_session() as session:
-            await session.execute(insert(Submenu).values(id=UUID(pk),
-                                                         title=data['title'],
-                                                         description=data['description'],
-                                                         menu_id=UUID(data['menu_id'])))
-            await session.commit()
-
-        redis.delete('list:menu')
-        redis.delete('list:submenu')
-        redis.delete(f'{data["menu_id"]}::')
-
-    # Get dishes from db
-    async with async_session() as session:
-        result = await session.execute(select(Dish))
-        dishes = result.scalars().all()
-
-    # Sync dishes
-    for dish in dishes:
-        uuid = str(dish.id)
-        if uuid not in s_dishes:
-            async with async_session() as session:
-                await session.execute(delete(Dish).where(Dish.id == UUID(uuid)))
-                await session.commit()
-
-            delete_if_keys_exists(redis, 'list:*')
-            delete_if_keys_exists(redis, '*::')
-            redis.delete(f'*:{dish.submenu_id}:*')
-            continue
-        elif not {
-            'title': dish.title,
-            'description': dish.description,
-            'submenu_id': dish.submenu_id,
-            'price': dish.price
-        } == s_dishes[uuid]:
-            new_title, new_desc, new_submenu_id, new_price = (s_dishes[uuid]['title'],
-                                                              s_dishes[uuid]['description'],
-                                                              s_dishes[uuid]['submenu_id'],
-                                                              s_dishes[uuid]['price'])
-            async with async_session() as session:
-                await session.execute(update(Dish)
-                                      .where(Dish.id == UUID(uuid))
-                                      .values(title=new_title,
-                                              description=new_desc,
-                                              submenu_id=new_submenu_id,
-                                              price=new_price))
-                await session.commit()
-
-            delete_if_keys_exists(redis, f'*:{dish.submenu_id}:{uuid}')
-            redis.delete('list:dish')
-        del s_dishes[uuid]
-
-    # Add new dishes from document to db
+        old = db_submenus.get(pk)
+        if old != data:
+            diff.upserts[Submenu].append({'id': UUID(pk), **data, 'menu_id': UUID(data['menu_id'])})
+            diff.keys.update(submenu_keys(data['menu_id'], pk))
+            if old and old['menu_id'] != data['menu_id']:
+                diff.tags.add(submenu_tag(old['menu_id'], pk))
+                diff.keys.update(submenu_keys(old['menu_id'], pk))
+
+    for pk in db_submenus.keys() - s_submenus.keys():
+        old_menu_id = db_submenus[pk]['menu_id']
+        diff.deletions[Submenu].append(UUID(pk))
+        diff.tags.add(submenu_tag(old_menu_id, pk))
+        diff.keys.update(submenu_keys(old_menu_id, pk))
+
+    # Dishes
     for pk, data in s_dishes.items():
-        async with async_session() as session:
-            await session.execute(insert(Dish).values(id=UUID(pk),
-                                                      title=data['title'],
-                                                      description=data['description'],
-                                                      price=data['price'],
-                                                      submenu_id=UUID(data['submenu_id'])))
-            await session.commit()
-
-        delete_if_keys_exists(redis, 'list:*')
-
-        delete_if_keys_exists(redis, '*::')
-        delete_if_keys_exists(redis, f'*:{data["submenu_id"]}:')
+        old = db_dishes.get(pk)
+        if old != data:
+            diff.upserts[Dish].append({'id': UUID(pk), **data, 'submenu_id': UUID(data['submenu_id'])})
+            diff.keys.update(dish_keys(data['submenu_id'], pk))
+            if old and old['submenu_id'] != data['submenu_id']:
+                diff.keys.update(dish_keys(old['submenu_id'], pk))
+
+    for pk in db_dishes.keys() - s_dishes.keys():
+        diff.deletions[Dish].append(UUID(pk))
+        diff.keys.update(dish_keys(db_dishes[pk]['submenu_id'], pk))
+
+    return diff
+
+
+async def apply_diff(diff: SyncDiff, session_maker: async_sessionmaker[AsyncSession] = async_session) -> None:
+    async with session_maker() as session:
+        async with session.begin():
+            # Parents first, so moved children always point to an existing row
+            for model in (Menu, Submenu, Dish):
+                rows = diff.upserts[model]
+                for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                    stmt = insert(model).values(rows[i:i + UPSERT_CHUNK_SIZE])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[model.__table__.c.id],
+                        set_={column: stmt.excluded[column] for column in rows[0] if column != 'id'}
+                    )
+                    await session.execute(stmt)
+
+            for model in (Dish, Submenu, Menu):
+                if diff.deletions[model]:
+                    ids = bindparam('ids', diff.deletions[model], type_=ARRAY(PG_UUID(as_uuid=True)))
+                    await session.execute(delete(model).where(model.__table__.c.id == any_(ids)))
+
+
+async def synchronize(rows: Iterable[SheetRow],
+                      redis: Redis,
+                      session_maker: async_sessionmaker[AsyncSession] = async_session) -> dict[str, float]:
+    timings: dict[str, float] = {}
+
+    with _phase(timings, 'parse'):
+        document, discounts = collect_from_document(rows)
+
+    with _phase(timings, 'load'):
+        tables = await tables_identity(session_maker)
+        if await redis.get(SYNC_TABLES_KEY) != tables.encode('utf-8'):
+            await redis.unlink(*SYNC_KEYS)
+        stored = await load_stored_states(redis)
+        stored_discounts = await load_stored_discounts(redis)
+        # The rows of a type whose state is missing (never applied, flushed, evicted) could have gone away unnoticed:
+        # then the whole db is compared
+        trusted = all(stored)
+        if not trusted:
+            db = await collect_from_db(session_maker)
+
+    with _phase(timings, 'diff'):
+        if trusted:
+            menu_of_submenu = {pk: state.split(':', 1)[0] for pk, state in stored[1].items()}
+            changed_document, db = select_changed(document, stored)
+            diff = compute_diff(changed_document, db, menu_of_submenu)
+        else:
+            diff = compute_diff(document, db)
+        keys = diff.keys | discount_keys(document, stored_discounts, discounts)
+
+    if diff:
+        with _phase(timings, 'apply'):
+            await apply_diff(diff, session_maker)
+
+    if diff.tags or keys:
+        with _phase(timings, 'invalidate'):
+            await invalidate(redis, *diff.tags, keys=keys)
+
+    await save_stored_states(redis, document, tables)
+    await save_stored_discounts(redis, discounts)
+
+    with _phase(timings, 'snapshot'):  # Discounts may have changed even when the tables did not
+        await renew_epoch(redis)
+        await refresh_tree_snapshot(redis, session_maker)
+
+    logger.info('Synchronization finished: %s',
+                ', '.join(f'{phase} {seconds * 1000:.1f} ms' for phase, seconds in timings.items()))
+
+    return timings
+
+
+async def synchronize_if_changed(redis: Redis,
+                                 path: str = WORKBOOK_PATH,
+                                 session_maker: async_sessionmaker[AsyncSession] = async_session) -> dict[str, float]:
+    stat = os.stat(path)
+    stat_token = f'{stat.st_mtime_ns}:{stat.st_size}'
+    stored_tables, stored_stat, stored_fingerprint = await redis.mget(SYNC_TABLES_KEY,
+                                                                      SYNC_STAT_KEY,
+                                                                      SYNC_FINGERPRINT_KEY)
+
+    # Tables recreated by init_db come with the state dropped, so an unchanged stat is enough here
+    if stored_stat and stored_stat.decode('utf-8') == stat_token:
+        return {}
+
+    with open(path, 'rb') as file:
+        fingerprint = hashlib.sha256(file.read()).hexdigest()
+
+    applied = bool(stored_fingerprint and stored_fingerprint.decode('utf-8') == fingerprint)
+    if applied:  # The workbook is only known to be applied to the tables the state was saved with
+        applied = stored_tables == (await tables_identity(session_maker)).encode('utf-8')
+
+    timings = {}
+    if not applied:
+        timings = await synchronize(iter_rows(path), redis, session_maker)
+
+    await redis.mset({SYNC_STAT_KEY: stat_token, SYNC_FINGERPRINT_KEY: fingerprint})
+
+    return timings
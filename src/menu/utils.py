@@ -1,21 +1,15 @@
-from functools import reduce
+from decimal import ROUND_HALF_UP, Decimal
 
-from .sheets_parser import get_rows
+from .discounts import discount_index
 
-
-def get_dishes_count_from_menu(menu) -> int:
-    return 0 if not menu.submenus else reduce(lambda x, y: x + y,
-                                              map(lambda x: len(x.dishes), menu.submenus))
+CENT = Decimal('0.01')
 
 
 def get_discounts() -> dict[str, str]:
-    values = get_rows()
-    discounts = {}
+    return discount_index.get()
 
-    for row in values:
-        if not (row[0] or row[1]):
-            [_, _, s_id, *n, discount] = row[:7]
-            if discount:
-                discounts[s_id] = str(discount)
 
-    return discounts
+def apply_discount(price: Decimal | str, discount: str) -> str:
+    # Rounds half away from zero, as round() does for the prices discounted in the db
+    discounted = Decimal(price) * (100 - Decimal(discount)) / 100
+    return f'{discounted.quantize(CENT, rounding=ROUND_HALF_UP)}'
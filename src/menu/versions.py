@@ -0,0 +1,117 @@
+from collections.abc import Iterable
+from uuid import uuid4
+
+from redis.asyncio import Redis
+
+from .local_cache import broadcast, local_cache
+
+# Version counters behind the ETags of the menu API, all fields of one hash. A "tree" counter is bumped by
+# any write below its entity (the cached counts change), a plain one only when the entity itself changes.
+# The epoch is renewed by every synchronization and recreated when Redis loses the hash, so counters that
+# restart from zero never reproduce a tag issued before.
+VERSIONS_KEY = 'versions'
+EPOCH_FIELD = 'epoch'
+ROOT_VERSION = 'root'
+
+
+def menu_version(menu_id) -> str:
+    return f'menu:{menu_id}'
+
+
+def menu_tree_version(menu_id) -> str:
+    return f'tree:{menu_id}'
+
+
+def submenu_version(submenu_id) -> str:
+    return f'submenu:{submenu_id}'
+
+
+def submenu_tree_version(menu_id, submenu_id) -> str:
+    return f'tree:{menu_id}:{submenu_id}'
+
+
+def dish_version(dish_id) -> str:
+    return f'dish:{dish_id}'
+
+
+# What each representation depends on
+
+def menu_list_versions() -> list[str]:
+    return [ROOT_VERSION]
+
+
+def menu_versions(menu_id) -> list[str]:
+    return [menu_tree_version(menu_id)]
+
+
+def submenu_list_versions(menu_id) -> list[str]:
+    return [menu_tree_version(menu_id)]
+
+
+def submenu_versions(menu_id, submenu_id) -> list[str]:
+    return [menu_version(menu_id), submenu_tree_version(menu_id, submenu_id)]
+
+
+def dish_list_versions(menu_id, submenu_id) -> list[str]:
+    return [menu_version(menu_id), submenu_tree_version(menu_id, submenu_id)]
+
+
+def dish_versions(menu_id, submenu_id, dish_id) -> list[str]:
+    return [menu_version(menu_id), submenu_version(submenu_id), dish_version(dish_id)]
+
+
+# What each write changes
+
+def menu_write_versions(menu_id) -> list[str]:
+    return [ROOT_VERSION, menu_version(menu_id), menu_tree_version(menu_id)]
+
+
+def submenu_write_versions(menu_id, *submenu_ids) -> list[str]:
+    return [ROOT_VERSION,
+            menu_tree_version(menu_id),
+            *(submenu_version(submenu_id) for submenu_id in submenu_ids),
+            *(submenu_tree_version(menu_id, submenu_id) for submenu_id in submenu_ids)]
+
+
+def dish_write_versions(menu_id, submenu_id, *dish_ids) -> list[str]:
+    return [ROOT_VERSION,
+            menu_tree_version(menu_id),
+            submenu_tree_version(menu_id, submenu_id),
+            *(dish_version(dish_id) for dish_id in dish_ids)]
+
+
+async def read_etag(redis: Redis, fields: Iterable[str]) -> str:
+    # Cached in the worker under the versions hash: any bump or new epoch drops every ETag read from it
+    fields = tuple(fields)
+    generation = local_cache.generation
+    etag = local_cache.get(VERSIONS_KEY, fields)
+
+    if etag is not None:
+        return etag
+
+    epoch, *counters = await redis.hmget(VERSIONS_KEY, EPOCH_FIELD, *fields)
+
+    if epoch is None:
+        if await redis.hsetnx(VERSIONS_KEY, EPOCH_FIELD, uuid4().hex):
+            await broadcast(redis, [VERSIONS_KEY])
+        generation = local_cache.generation
+        epoch, *counters = await redis.hmget(VERSIONS_KEY, EPOCH_FIELD, *fields)
+
+    etag = '"{}"'.format(b'.'.join([epoch] + [counter or b'0' for counter in counters]).decode('ascii'))
+    local_cache.set(VERSIONS_KEY, fields, etag, generation)
+
+    return etag
+
+
+async def bump_versions(redis: Redis, fields: Iterable[str]) -> None:
+    async with redis.pipeline(transaction=False) as pipe:
+        for field in fields:
+            pipe.hincrby(VERSIONS_KEY, field, 1)
+        await pipe.execute()
+
+    await broadcast(redis, [VERSIONS_KEY])
+
+
+async def renew_epoch(redis: Redis) -> None:
+    await redis.hset(VERSIONS_KEY, EPOCH_FIELD, uuid4().hex)
+    await broadcast(redis, [VERSIONS_KEY])
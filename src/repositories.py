@@ -2,14 +2,28 @@ from abc import ABC, abstractmethod
 from typing import Any, Sequence
 from uuid import UUID
 
-from sqlalchemy import Row, RowMapping, delete, select, update
+from sqlalchemy import (
+    Row,
+    RowMapping,
+    any_,
+    bindparam,
+    column,
+    delete,
+    insert,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.selectable import Select
 
-from src.database import async_session
 from src.menu.models import Base
 
 
 class AbstractRepository(ABC):
-    session_maker = None
+    session: AsyncSession
 
     @abstractmethod
     async def retrieve_list(self):
@@ -27,50 +41,144 @@ class AbstractRepository(ABC):
     async def update(self, pk: UUID, data: dict):
         raise NotImplementedError
 
+    @abstractmethod
+    async def create_and_retrieve(self, data: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_and_retrieve(self, pk: UUID, data: dict):
+        raise NotImplementedError
+
     @abstractmethod
     async def delete(self, pk: UUID):
         raise NotImplementedError
 
+    @abstractmethod
+    async def bulk_create(self, rows: list[dict]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def bulk_update(self, rows: list[dict], **filters):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def bulk_delete(self, pks: list[UUID], **filters):
+        raise NotImplementedError
+
 
 class SQLAlchemyRepository(AbstractRepository):
-    session_maker = async_session
+    # Repositories share the session of the request's unit of work and never commit themselves
 
-    def __init__(self, model):
+    def __init__(self, model, session: AsyncSession):
         self.model = model
+        self.session = session
+
+    def returning_columns(self, *, created: bool = False) -> tuple:
+        return tuple(self.model.__table__.columns)
+
+    def paginate(self, query: Select, after: UUID | None = None, limit: int | None = None) -> Select:
+        if after:
+            query = query.where(self.model.id > after)
+
+        return query.order_by(self.model.id).limit(limit)
 
     async def retrieve_list(self) -> Sequence[Row[Base] | RowMapping | Any]:
-        async with self.session_maker() as session:
-            query = select(self.model)
-            result = await session.execute(query)
+        query = select(self.model)
+        result = await self.session.execute(query)
 
-            return result.scalars().all()
+        return result.scalars().all()
 
     async def retrieve_one(self, pk: UUID) -> Base:
-        async with self.session_maker() as session:
-            obj = await session.get(self.model, pk)
+        obj = await self.session.get(self.model, pk)
 
-            return obj
+        return obj
 
     async def create(self, data: dict) -> UUID:
-        async with self.session_maker() as session:
-            obj = self.model(**data)
-            session.add(obj)
-            await session.commit()
+        obj = self.model(**data)
+        self.session.add(obj)
+        await self.session.flush()
 
-            return obj.id
+        return obj.id
 
     async def update(self, pk: UUID, data: dict) -> None:
-        async with self.session_maker() as session:
-            stmt = (update(self.model)
-                    .where(self.model.id == pk)
-                    .values(**data)
-                    )
+        stmt = (update(self.model)
+                .where(self.model.id == pk)
+                .values(**data)
+                )
+
+        await self.session.execute(stmt)
 
-            await session.execute(stmt)
-            await session.commit()
+    async def create_and_retrieve(self, data: dict) -> Row:
+        stmt = (insert(self.model)
+                .values(**data)
+                .returning(*self.returning_columns(created=True))
+                )
+
+        result = await self.session.execute(stmt)
+
+        return result.one()
+
+    async def update_and_retrieve(self, pk: UUID, data: dict) -> Row | None:
+        stmt = (update(self.model)
+                .where(self.model.id == pk)
+                .values(**data)
+                .returning(*self.returning_columns())
+                )
+
+        result = await self.session.execute(stmt)
+
+        return result.first()
 
     async def delete(self, pk: UUID) -> None:
-        async with self.session_maker() as session:
-            stmt = delete(self.model).where(self.model.id == pk)
-            await session.execute(stmt)
-            await session.commit()
+        stmt = delete(self.model).where(self.model.id == pk)
+        await self.session.execute(stmt)
+
+    # Each bulk method is one multi-row statement; filters (e.g. submenu_id=...) keep a batch inside its parent
+
+    async def bulk_create(self, rows: list[dict]) -> Sequence[Row]:
+        if not rows:
+            return []
+
+        stmt = (insert(self.model)
+                .values(rows)
+                .returning(*self.returning_columns(created=True))
+                )
+
+        result = await self.session.execute(stmt)
+
+        return result.all()
+
+    async def bulk_update(self, rows: list[dict], **filters) -> Sequence[Row]:
+        if not rows:
+            return []
+
+        names = list(rows[0])
+        table = self.model.__table__
+        data = (values(*(column(name, table.c[name].type) for name in names), name='data')
+                .data([tuple(row[name] for name in names) for row in rows]))
+
+        stmt = (update(self.model)
+                .where(self.model.id == data.c.id)
+                .filter_by(**filters)
+                .values({name: data.c[name] for name in names if name != 'id'})
+                .returning(*self.returning_columns())
+                )
+
+        result = await self.session.execute(stmt)
+
+        return result.all()
+
+    async def bulk_delete(self, pks: list[UUID], **filters) -> list[UUID]:
+        if not pks:
+            return []
+
+        ids = bindparam('ids', pks, type_=ARRAY(PG_UUID(as_uuid=True)))
+        stmt = (delete(self.model)
+                .where(self.model.id == any_(ids))
+                .filter_by(**filters)
+                .returning(self.model.id)
+                )
+
+        result = await self.session.execute(stmt)
+
+        return list(result.scalars())
@@ -0,0 +1,32 @@
+from types import TracebackType
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.database import async_session
+
+
+class UnitOfWork:
+    # One session (and so at most one pooled connection) for the whole request
+
+    session: AsyncSession
+
+    def __init__(self, session_maker: async_sessionmaker = async_session):
+        self.session_maker = session_maker
+
+    async def __aenter__(self) -> 'UnitOfWork':
+        self.session = self.session_maker()
+        return self
+
+    async def __aexit__(self,
+                        exc_type: type[BaseException] | None,
+                        exc: BaseException | None,
+                        tb: TracebackType | None) -> None:
+        if exc_type:
+            await self.session.rollback()
+        await self.session.close()
+
+    async def commit(self) -> None:
+        await self.session.commit()
+
+    async def rollback(self) -> None:
+        await self.session.rollback()
@@ -2,11 +2,12 @@ from typing import AsyncGenerator
 
 import pytest
 from httpx import AsyncClient
-from redis import Redis
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from config import DB_NAME_TEST, DB_PASSWORD_TEST, DB_PORT_TEST, DB_USER_TEST
 from src.main import app
+from src.menu.local_cache import local_cache
 from src.menu.models import Base
 
 DATABASE_URL_TEST = (f'postgresql+asyncpg://'
@@ -31,8 +32,8 @@ async def override_get_db(*args) -> AsyncGenerator[AsyncSession, None]:
 async def setup_redis() -> AsyncGenerator:
     app.state.redis = redis
     yield
-    app.state.redis.flushall()
-    app.state.redis.close()
+    await app.state.redis.flushall()
+    await app.state.redis.aclose()
 
 
 @pytest.fixture(scope='function', autouse=True)
@@ -42,6 +43,8 @@ async def setup_db() -> AsyncGenerator:
     yield
     async with engine_test.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
+    await redis.flushdb()  # Cached snapshots must not outlive the tables they were built from
+    local_cache.clear()
 
 
 @pytest.fixture(scope='session')
@@ -62,8 +65,8 @@ def test_data() -> dict[str, dict]:
         'submenu_data': {'title': 'Submenu 1', 'description': 'Submenu description 1'},
         'update_menu_data': {'title': 'Updated submenu', 'description': 'Updated submenu description'},
         'update_submenu_data': {'title': 'Updated submenu', 'description': 'Updated submenu description'},
-        'dish_data': {'title': 'Dish 1', 'description': 'Dish description 1', 'price': '10.5'},
-        'update_dish_data': {'title': 'Updated dish', 'description': 'Updated dish description', 'price': '15.5'}
+        'dish_data': {'title': 'Dish 1', 'description': 'Dish description 1', 'price': '10.50'},
+        'update_dish_data': {'title': 'Updated dish', 'description': 'Updated dish description', 'price': '15.50'}
     }
 
     return test_data
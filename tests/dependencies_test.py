@@ -1,22 +1,25 @@
+from typing import AsyncGenerator
+
 from conftest import async_session_test
+from fastapi import Depends
 
 from src.menu.repository import DishRepository, MenuRepository, SubmenuRepository
 from src.menu.service import DishService, MenuService, SubmenuService
+from src.unit_of_work import UnitOfWork
+
+
+async def override_get_unit_of_work() -> AsyncGenerator[UnitOfWork, None]:
+    async with UnitOfWork(async_session_test) as uow:
+        yield uow
 
 
-def override_get_menu_service() -> MenuService:
-    repo = MenuRepository()
-    repo.session_maker = async_session_test  # type: ignore
-    return MenuService(repo)
+def override_get_menu_service(uow: UnitOfWork = Depends(override_get_unit_of_work)) -> MenuService:
+    return MenuService(MenuRepository(uow.session), uow)
 
 
-def override_get_submenu_service() -> SubmenuService:
-    repo = SubmenuRepository()
-    repo.session_maker = async_session_test  # type: ignore
-    return SubmenuService(repo)
+def override_get_submenu_service(uow: UnitOfWork = Depends(override_get_unit_of_work)) -> SubmenuService:
+    return SubmenuService(SubmenuRepository(uow.session), uow)
 
 
-def override_get_dish_service() -> DishService:
-    repo = DishRepository()
-    repo.session_maker = async_session_test  # type: ignore
-    return DishService(repo)
+def override_get_dish_service(uow: UnitOfWork = Depends(override_get_unit_of_work)) -> DishService:
+    return DishService(DishRepository(uow.session), uow)
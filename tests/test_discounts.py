@@ -0,0 +1,48 @@
+import os
+import uuid
+
+import pytest
+import utils_test
+
+from src.menu import discounts
+from src.menu.discounts import DiscountIndex
+
+
+@pytest.mark.anyio
+async def test_discount_index_reloads_changed_workbook(tmp_path, monkeypatch):
+    menu_id, submenu_id, dish_id = (str(uuid.uuid4()) for _ in range(3))
+    path = str(tmp_path / 'MenuSheets.xlsx')
+    utils_test.write_workbook(path, utils_test.workbook_rows(menu_id, submenu_id, dish_id, discount=20))
+    parses = []
+    parse = discounts.parse_discounts
+
+    def parse_discounts(rows):
+        parses.append(path)
+        return parse(rows)
+
+    monkeypatch.setattr(discounts, 'parse_discounts', parse_discounts)
+    index = DiscountIndex(path)
+
+    assert index.get() == {dish_id: '20'}
+    assert index.get() == {dish_id: '20'}
+    assert len(parses) == 1  # Same mtime: the workbook is not read again
+
+    mtime = os.stat(path).st_mtime_ns + 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+    assert index.get() == {dish_id: '20'}
+    assert len(parses) == 1  # Touched but not changed: the digest matches
+
+    utils_test.write_workbook(path, utils_test.workbook_rows(menu_id, submenu_id, dish_id, discount=30))
+    os.utime(path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    assert index.get() == {dish_id: '30'}
+    assert len(parses) == 2
+
+    *rows, dish = utils_test.workbook_rows(menu_id, submenu_id, dish_id, discount=40)
+    utils_test.write_workbook(path, [*rows, (*dish[:5], 'ten', *dish[6:])])
+    os.utime(path, ns=(mtime + 2 * 10 ** 9, mtime + 2 * 10 ** 9))
+    assert index.get() == {dish_id: '30'}  # An invalid workbook keeps the last index
+    assert index.get() == {dish_id: '30'}
+    assert len(parses) == 3  # and is not read again until it changes
+
+    os.remove(path)
+    assert index.get() == {dish_id: '30'}  # A missing workbook keeps the last index
@@ -110,6 +110,46 @@ async def test_add_dish(ac: AsyncClient, test_data: dict[str, dict]):
                                                   body['price']))
 
 
+@pytest.mark.anyio
+async def test_add_dish_formats_price(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    test_data['submenu_data']['menu_id'] = str(menu_id)
+    submenu_id = await utils_test.fill_submenu_table_and_return_id(test_data['submenu_data'])
+
+    add_dish_url = get_url_from_api_route_name(app,
+                                               'add_dish',
+                                               menu_id=menu_id,
+                                               submenu_id=submenu_id)
+    response = await ac.post(add_dish_url, json={**test_data['dish_data'], 'price': '9.5'})
+    assert response.status_code == 201
+    assert response.json()['price'] == '9.50'
+
+    get_dish_url = get_url_from_api_route_name(app,
+                                               'get_dish',
+                                               menu_id=menu_id,
+                                               submenu_id=submenu_id,
+                                               dish_id=response.json()['id'])
+    response = await ac.get(get_dish_url)
+    assert response.json()['price'] == '9.50'
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('price', ['123456789.5', '9.505'])
+async def test_add_dish_rejects_price_out_of_column(ac: AsyncClient, test_data: dict[str, dict], price: str):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    test_data['submenu_data']['menu_id'] = str(menu_id)
+    submenu_id = await utils_test.fill_submenu_table_and_return_id(test_data['submenu_data'])
+    dish_data = {**test_data['dish_data'], 'price': price}
+
+    add_dish_url = get_url_from_api_route_name(app, 'add_dish', menu_id=menu_id, submenu_id=submenu_id)
+    response = await ac.post(add_dish_url, json=dish_data)
+    assert response.status_code == 422
+
+    batch_dishes_url = get_url_from_api_route_name(app, 'batch_dishes', menu_id=menu_id, submenu_id=submenu_id)
+    response = await ac.post(batch_dishes_url, json={'create': [dish_data]})
+    assert response.status_code == 422
+
+
 @pytest.mark.anyio
 async def test_update_dish(ac: AsyncClient, test_data: dict[str, dict]):
     menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
@@ -156,3 +196,30 @@ async def test_delete_dish(ac: AsyncClient, test_data: dict[str, dict]):
 
     dishes = await utils_test.get_dishes()
     assert dishes == []
+
+
+@pytest.mark.anyio
+async def test_batch_dishes(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    test_data['submenu_data']['menu_id'] = str(menu_id)
+    submenu_id = await utils_test.fill_submenu_table_and_return_id(test_data['submenu_data'])
+
+    batch_dishes_url = get_url_from_api_route_name(app, 'batch_dishes', menu_id=menu_id, submenu_id=submenu_id)
+    response = await ac.post(batch_dishes_url, json={'create': [test_data['dish_data'], test_data['update_dish_data']]})
+    assert response.status_code == 200
+
+    created = response.json()['created']
+    assert sorted(dish['title'] for dish in created) == sorted([test_data['dish_data']['title'],
+                                                                test_data['update_dish_data']['title']])
+
+    response = await ac.post(batch_dishes_url, json={
+        'update': [{**test_data['update_dish_data'], 'id': created[0]['id']}],
+        'delete': [created[1]['id']],
+    })
+    assert response.status_code == 200
+    assert response.json()['deleted'] == [created[1]['id']]
+
+    get_dishes_url = get_url_from_api_route_name(app, 'get_dishes', menu_id=menu_id, submenu_id=submenu_id)
+    response = await ac.get(get_dishes_url)
+    assert [(dish['id'], dish['title']) for dish in response.json()] == [(created[0]['id'],
+                                                                          test_data['update_dish_data']['title'])]
@@ -1,5 +1,7 @@
+import asyncio
 import uuid
 
+import orjson
 import pytest
 import utils_test
 from dependencies_test import (
@@ -10,11 +12,15 @@ from dependencies_test import (
 from httpx import AsyncClient
 
 from src.main import app
+from src.menu.cache_policy import MENU
 from src.menu.dependencies import (
     get_dish_service,
     get_menu_service,
     get_submenu_service,
 )
+from src.menu.local_cache import local_cache
+from src.menu.redis_utils import MENU_LIST_KEY, menu_key
+from src.menu.single_flight import single_flight
 from src.utils import get_url_from_api_route_name
 
 app.dependency_overrides[get_dish_service] = override_get_dish_service
@@ -43,6 +49,38 @@ async def test_get_menus(ac: AsyncClient, test_data: dict[str, dict]):
                                                         body['description']))
 
 
+@pytest.mark.anyio
+async def test_get_menus_paginated(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_ids = sorted([await utils_test.fill_menu_table_and_return_id(test_data['menu_data']) for _ in range(3)])
+    get_menus_url = get_url_from_api_route_name(app, 'get_menus')
+
+    response = await ac.get(get_menus_url, params={'limit': 2})
+    assert response.status_code == 200
+    assert [uuid.UUID(menu['id']) for menu in response.json()] == menu_ids[:2]
+
+    cursor = response.headers['X-Next-Cursor']
+    response = await ac.get(get_menus_url, params={'limit': 2, 'cursor': cursor})
+    assert response.status_code == 200
+    assert [uuid.UUID(menu['id']) for menu in response.json()] == menu_ids[2:]
+    assert 'X-Next-Cursor' not in response.headers
+
+    response = await ac.get(get_menus_url, params={'cursor': 'not a cursor'})
+    assert response.status_code == 400
+    assert response.json() == {'detail': 'invalid cursor'}
+
+
+@pytest.mark.anyio
+async def test_get_menus_fills_cache_once(ac: AsyncClient, test_data: dict[str, dict]):
+    await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    get_menus_url = get_url_from_api_route_name(app, 'get_menus')
+
+    responses = await asyncio.gather(*[ac.get(get_menus_url) for _ in range(3)])
+    assert len({response.content for response in responses}) == 1
+
+    cached = await app.state.redis.hgetall(MENU_LIST_KEY)
+    assert list(cached.values()) == [responses[0].content]
+
+
 @pytest.mark.anyio
 async def test_get_menu(ac: AsyncClient, test_data: dict[str, dict]):
     get_menu_url = get_url_from_api_route_name(app, 'get_menu', menu_id=uuid.uuid4())
@@ -65,6 +103,85 @@ async def test_get_menu(ac: AsyncClient, test_data: dict[str, dict]):
                                                         body['description']))
 
 
+@pytest.mark.anyio
+async def test_get_menu_not_modified(ac: AsyncClient, test_data: dict[str, dict]):
+    response = await ac.post(get_url_from_api_route_name(app, 'add_menu'), json=test_data['menu_data'])
+    menu_id = response.json()['id']
+
+    get_menu_url = get_url_from_api_route_name(app, 'get_menu', menu_id=menu_id)
+    response = await ac.get(get_menu_url)
+    etag = response.headers['etag']
+
+    response = await ac.get(get_menu_url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['etag'] == etag
+
+    # A new submenu changes the menu's submenus_count
+    add_submenu_url = get_url_from_api_route_name(app, 'add_submenu', menu_id=menu_id)
+    await ac.post(add_submenu_url, json=test_data['submenu_data'])
+
+    response = await ac.get(get_menu_url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()['submenus_count'] == 1
+
+
+@pytest.mark.anyio
+async def test_get_menu_if_none_match_any(ac: AsyncClient):
+    get_menu_url = get_url_from_api_route_name(app, 'get_menu', menu_id=uuid.uuid4())
+
+    response = await ac.get(get_menu_url, headers={'If-None-Match': '*'})
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_get_menu_single_flight(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    get_menu_url = get_url_from_api_route_name(app, 'get_menu', menu_id=menu_id)
+    metrics = single_flight.metrics.snapshot()
+
+    responses = await asyncio.gather(*[ac.get(get_menu_url) for _ in range(5)])
+    assert [response.status_code for response in responses] == [200] * 5
+    assert single_flight.metrics.loads == metrics['loads'] + 1  # The rest were coalesced or hit the cache
+
+
+@pytest.mark.anyio
+async def test_get_menu_cache_stats(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    get_menu_url = get_url_from_api_route_name(app, 'get_menu', menu_id=menu_id)
+    get_cache_stats_url = get_url_from_api_route_name(app, 'get_cache_stats')
+    stats = (await ac.get(get_cache_stats_url)).json()['entities'][MENU]
+
+    await ac.get(get_menu_url)
+    await ac.get(get_menu_url)
+
+    local_cache.drop([menu_key(menu_id)])
+    await ac.get(get_menu_url)
+
+    response = await ac.get(get_cache_stats_url)
+    assert response.status_code == 200
+    assert response.json()['entities'][MENU] == {**stats, 'hits': stats['hits'] + 1, 'misses': stats['misses'] + 1}
+    assert set(response.json()['db_pool']) == {'checkouts', 'slow_checkouts', 'avg_wait_ms', 'max_wait_ms'}
+    assert 0 < await app.state.redis.ttl(menu_key(menu_id))
+
+
+@pytest.mark.anyio
+async def test_get_menu_from_local_cache(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    get_menu_url = get_url_from_api_route_name(app, 'get_menu', menu_id=menu_id)
+    response = await ac.get(get_menu_url)
+
+    # Served from memory while Redis no longer has it
+    await app.state.redis.unlink(menu_key(menu_id))
+    assert (await ac.get(get_menu_url)).content == response.content
+
+    # A write drops the worker's copy
+    update_menu_url = get_url_from_api_route_name(app, 'update_menu', menu_id=menu_id)
+    await ac.patch(update_menu_url, json=test_data['update_menu_data'])
+
+    response = await ac.get(get_menu_url)
+    assert response.json()['title'] == test_data['update_menu_data']['title']
+
+
 @pytest.mark.anyio
 async def test_add_menu(ac: AsyncClient, test_data: dict[str, dict]):
     add_menu_url = get_url_from_api_route_name(app, 'add_menu')
@@ -78,6 +195,18 @@ async def test_add_menu(ac: AsyncClient, test_data: dict[str, dict]):
                                                         body['description']))
 
 
+@pytest.mark.anyio
+async def test_add_menu_writes_through_cache(ac: AsyncClient, test_data: dict[str, dict]):
+    add_menu_url = get_url_from_api_route_name(app, 'add_menu')
+
+    response = await ac.post(add_menu_url, json=test_data['menu_data'])
+    assert response.status_code == 201
+
+    menu_id = response.json()['id']
+    cached = await app.state.redis.get(menu_key(menu_id))
+    assert orjson.loads(cached) == response.json()
+
+
 @pytest.mark.anyio
 async def test_update_menus(ac: AsyncClient, test_data: dict[str, dict]):
     menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
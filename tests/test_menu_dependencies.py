@@ -13,6 +13,7 @@ from src.menu.dependencies import (
     get_menu_service,
     get_submenu_service,
 )
+from src.menu.redis_utils import expire_tree_snapshot
 from src.utils import get_url_from_api_route_name
 
 app.dependency_overrides[get_dish_service] = override_get_dish_service
@@ -39,6 +40,7 @@ async def test_get_menus_with_dependencies(ac: AsyncClient, test_data: dict[str,
 
     dish_id = await utils_test.fill_dish_table_and_return_id(test_data['dish_data'])
     test_data['dish_data']['id'] = str(dish_id)
+    await expire_tree_snapshot(app.state.redis)  # Direct db writes bypass the service layer
 
     response = await ac.get(url)
     assert response.status_code == 200
@@ -60,3 +62,42 @@ async def test_get_menus_with_dependencies(ac: AsyncClient, test_data: dict[str,
     ]
 
     assert expected == response.json()
+
+
+@pytest.mark.anyio
+async def test_stream_menus_with_dependencies(ac: AsyncClient, test_data: dict[str, dict]):
+    url = get_url_from_api_route_name(app, 'get_menus_with_dependencies')
+    response = await ac.get(url, params={'stream': True})
+    assert response.status_code == 200
+    assert response.json() == []
+
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    await utils_test.fill_menu_table_and_return_id(test_data['update_menu_data'])  # Menu without submenus
+    test_data['submenu_data']['menu_id'] = str(menu_id)
+    submenu_id = await utils_test.fill_submenu_table_and_return_id(test_data['submenu_data'])
+    test_data['dish_data']['submenu_id'] = str(submenu_id)
+    await utils_test.fill_dish_table_and_return_id(test_data['dish_data'])
+
+    streamed = await ac.get(url, params={'stream': True})
+    assert streamed.status_code == 200
+
+    response = await ac.get(url)
+    assert sorted(streamed.json(), key=lambda menu: menu['id']) == sorted(response.json(), key=lambda menu: menu['id'])
+
+
+@pytest.mark.anyio
+async def test_menus_with_dependencies_snapshot(ac: AsyncClient, test_data: dict[str, dict]):
+    url = get_url_from_api_route_name(app, 'get_menus_with_dependencies')
+    response = await ac.get(url)
+    assert response.status_code == 200
+    etag = response.headers['etag']
+
+    response = await ac.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    await ac.post(get_url_from_api_route_name(app, 'add_menu'), json=test_data['menu_data'])
+
+    response = await ac.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+    assert response.json()[0]['title'] == test_data['menu_data']['title']
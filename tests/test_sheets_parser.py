@@ -0,0 +1,54 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+import utils_test
+
+from src.menu.sheets_parser import DishRow, MenuRow, SubmenuRow, iter_rows
+
+
+@pytest.mark.anyio
+async def test_iter_rows(tmp_path):
+    menu_id, submenu_id, dish_id, other_menu_id = (str(uuid.uuid4()) for _ in range(4))
+    rows = [*utils_test.workbook_rows(menu_id, submenu_id, dish_id, discount=20),
+            (other_menu_id, 'Menu 2', 'Menu description 2')]
+    path = utils_test.write_workbook(str(tmp_path / 'MenuSheets.xlsx'), rows)
+
+    assert list(iter_rows(path)) == [
+        MenuRow(id=menu_id, title='Menu 1', description='Menu description 1'),
+        SubmenuRow(id=submenu_id, title='Submenu 1', description='Submenu description 1', menu_id=menu_id),
+        DishRow(id=dish_id,
+                title='Dish 1',
+                description='Dish description 1',
+                price=Decimal('10.5'),
+                discount='20',
+                submenu_id=submenu_id),
+        MenuRow(id=other_menu_id, title='Menu 2', description='Menu description 2'),
+    ]
+
+
+@pytest.mark.anyio
+async def test_iter_rows_rejects_orphan_rows(tmp_path):
+    menu_id, submenu_id, dish_id, other_menu_id = (str(uuid.uuid4()) for _ in range(4))
+    rows = utils_test.workbook_rows(menu_id, submenu_id, dish_id)
+
+    orphan_submenu = utils_test.write_workbook(str(tmp_path / 'submenu.xlsx'), rows[1:])
+    with pytest.raises(ValueError, match='row 1'):
+        list(iter_rows(orphan_submenu))
+
+    # A dish below a new menu does not belong to the submenu of the previous one
+    orphan_dish = utils_test.write_workbook(str(tmp_path / 'dish.xlsx'),
+                                            [*rows[:2], (other_menu_id, 'Menu 2', 'Menu description 2'), rows[2]])
+    with pytest.raises(ValueError, match='row 4'):
+        list(iter_rows(orphan_dish))
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('price', [None, 'ten'])
+async def test_iter_rows_rejects_invalid_price(tmp_path, price):
+    menu_id, submenu_id, dish_id = (str(uuid.uuid4()) for _ in range(3))
+    *rows, dish = utils_test.workbook_rows(menu_id, submenu_id, dish_id)
+    path = utils_test.write_workbook(str(tmp_path / 'MenuSheets.xlsx'), [*rows, (*dish[:5], price, *dish[6:])])
+
+    with pytest.raises(ValueError, match='row 3'):
+        list(iter_rows(path))
@@ -0,0 +1,36 @@
+import asyncio
+from contextlib import suppress
+
+import pytest
+from conftest import redis
+
+from src.menu.single_flight import LOCK_RELEASED_CHANNEL, RELEASE_LOCK, SingleFlight
+
+
+@pytest.mark.anyio
+async def test_single_flight_waits_for_lock_release():
+    flight = SingleFlight(lock_timeout_ms=10000)
+    watcher = asyncio.create_task(flight.watch_releases(redis))
+    cache: dict[str, bytes] = {}
+
+    async def read() -> bytes | None:
+        return cache.get('key')
+
+    async def load() -> bytes:
+        raise AssertionError('The lock holder fills the key')
+
+    await redis.set('lock:key', 'other worker')  # Another worker is loading the key
+    waiter = asyncio.create_task(flight.run(redis, 'key', read, load))
+    await asyncio.sleep(0.1)
+
+    cache['key'] = b'body'
+    await redis.eval(RELEASE_LOCK, 1, 'lock:key', 'other worker', LOCK_RELEASED_CHANNEL)
+
+    try:
+        # Woken by the release, long before the lock would have expired
+        assert await asyncio.wait_for(waiter, 1) == b'body'
+        assert flight.metrics.snapshot()['coalesced_remote'] == 1
+    finally:
+        watcher.cancel()
+        with suppress(asyncio.CancelledError):
+            await watcher
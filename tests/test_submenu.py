@@ -1,3 +1,4 @@
+import asyncio
 import uuid
 
 import pytest
@@ -10,11 +11,14 @@ from dependencies_test import (
 from httpx import AsyncClient
 
 from src.main import app
+from src.menu import cache_policy
 from src.menu.dependencies import (
     get_dish_service,
     get_menu_service,
     get_submenu_service,
 )
+from src.menu.local_cache import local_cache
+from src.menu.redis_utils import menu_key, menu_tag, submenu_key
 from src.utils import get_url_from_api_route_name
 
 app.dependency_overrides[get_dish_service] = override_get_dish_service
@@ -92,6 +96,22 @@ async def test_add_submenu(ac: AsyncClient, test_data: dict[str, dict]):
                                                            body['description']))
 
 
+@pytest.mark.anyio
+async def test_add_submenu_patches_cached_menu_counter(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    response = await ac.get(get_url_from_api_route_name(app, 'get_menu', menu_id=menu_id))
+    assert response.status_code == 200
+    cached = await app.state.redis.get(menu_key(menu_id))
+
+    add_submenu_url = get_url_from_api_route_name(app, 'add_submenu', menu_id=menu_id)
+    response = await ac.post(add_submenu_url, json=test_data['submenu_data'])
+    assert response.status_code == 201
+
+    # Only the counter changes, the rest of the cached bytes are kept as they are
+    assert await app.state.redis.get(menu_key(menu_id)) == cached.replace(b'"submenus_count":0',
+                                                                          b'"submenus_count":1')
+
+
 @pytest.mark.anyio
 async def test_update_submenus(ac: AsyncClient, test_data: dict[str, dict]):
     menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
@@ -132,3 +152,74 @@ async def test_delete_submenu(ac: AsyncClient, test_data: dict[str, dict]):
 
     submenus = await utils_test.get_submenus()
     assert submenus == []
+
+
+@pytest.mark.anyio
+async def test_sliding_hit_renews_tags(ac: AsyncClient, test_data: dict[str, dict], monkeypatch):
+    monkeypatch.setattr(cache_policy, 'CACHE_SLIDING_EXPIRY', True)
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    test_data['submenu_data']['menu_id'] = str(menu_id)
+    submenu_id = await utils_test.fill_submenu_table_and_return_id(test_data['submenu_data'])
+
+    get_submenu_url = get_url_from_api_route_name(app, 'get_submenu', menu_id=menu_id, submenu_id=submenu_id)
+    assert (await ac.get(get_submenu_url)).status_code == 200
+
+    # The tag is about to expire while the key is still read
+    await app.state.redis.expire(menu_tag(menu_id), 1)
+    local_cache.drop([submenu_key(menu_id, submenu_id)])
+    assert (await ac.get(get_submenu_url)).status_code == 200
+    await asyncio.sleep(1.5)
+
+    delete_menu_url = get_url_from_api_route_name(app, 'delete_menu', menu_id=menu_id)
+    assert (await ac.delete(delete_menu_url)).status_code == 200
+
+    assert not await app.state.redis.exists(submenu_key(menu_id, submenu_id))
+    assert (await ac.get(get_submenu_url)).status_code == 404
+
+
+@pytest.mark.anyio
+async def test_get_submenus_cached_per_menu(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    other_menu_id = await utils_test.fill_menu_table_and_return_id(test_data['update_menu_data'])
+    test_data['submenu_data']['menu_id'] = str(menu_id)
+    submenu_id = await utils_test.fill_submenu_table_and_return_id(test_data['submenu_data'])
+
+    response = await ac.get(get_url_from_api_route_name(app, 'get_submenus', menu_id=menu_id))
+    assert response.status_code == 200
+    assert [uuid.UUID(submenu['id']) for submenu in response.json()] == [submenu_id]
+
+    # The first menu's list is cached now, it must not be served for another menu
+    response = await ac.get(get_url_from_api_route_name(app, 'get_submenus', menu_id=other_menu_id))
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_batch_submenus(ac: AsyncClient, test_data: dict[str, dict]):
+    menu_id = await utils_test.fill_menu_table_and_return_id(test_data['menu_data'])
+    other_menu_id = await utils_test.fill_menu_table_and_return_id(test_data['update_menu_data'])
+    submenu_id = await utils_test.fill_submenu_table_and_return_id({**test_data['submenu_data'], 'menu_id': menu_id})
+    other_submenu_id = await utils_test.fill_submenu_table_and_return_id({**test_data['submenu_data'],
+                                                                          'menu_id': other_menu_id})
+
+    batch_submenus_url = get_url_from_api_route_name(app, 'batch_submenus', menu_id=menu_id)
+    response = await ac.post(batch_submenus_url, json={
+        'create': [test_data['submenu_data']],
+        'update': [{**test_data['update_submenu_data'], 'id': str(submenu_id)}],
+        'delete': [str(submenu_id), str(other_submenu_id)],
+    })
+    assert response.status_code == 200
+
+    # A submenu of another menu is out of the batch's reach
+    body = response.json()
+    assert [submenu['title'] for submenu in body['created']] == [test_data['submenu_data']['title']]
+    assert [submenu['title'] for submenu in body['updated']] == [test_data['update_submenu_data']['title']]
+    assert body['deleted'] == [str(submenu_id)]
+
+    response = await ac.get(get_url_from_api_route_name(app, 'get_submenus', menu_id=menu_id))
+    assert [submenu['id'] for submenu in response.json()] == [body['created'][0]['id']]
+
+    response = await ac.get(get_url_from_api_route_name(app, 'get_submenu',
+                                                        menu_id=other_menu_id,
+                                                        submenu_id=other_submenu_id))
+    assert response.status_code == 200
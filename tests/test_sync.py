@@ -0,0 +1,206 @@
+import os
+import uuid
+from decimal import Decimal
+
+import pytest
+import utils_test
+from conftest import async_session_test, engine_test, redis
+from dependencies_test import override_get_menu_service
+from httpx import AsyncClient
+
+from src.main import app
+from src.menu.dependencies import get_menu_service
+from src.menu.models import Base, Dish, Menu, Submenu
+from src.menu.redis_utils import (
+    MENU_LIST_KEY,
+    SYNC_ROWS_KEYS,
+    dish_key,
+    dish_list_key,
+    menu_key,
+    menu_tag,
+    submenu_key,
+    submenu_list_key,
+    submenu_tag,
+)
+from src.menu.tasks_utils import (
+    apply_diff,
+    collect_from_db,
+    compute_diff,
+    discount_keys,
+    synchronize_if_changed,
+)
+from src.utils import get_url_from_api_route_name
+
+app.dependency_overrides[get_menu_service] = override_get_menu_service
+
+MENU_ID, OTHER_MENU_ID, SUBMENU_ID, OTHER_SUBMENU_ID, DISH_ID = (str(uuid.uuid4()) for _ in range(5))
+
+
+def document() -> tuple[dict, dict, dict]:
+    menus = {MENU_ID: {'title': 'Menu 1', 'description': 'Menu description 1'},
+             OTHER_MENU_ID: {'title': 'Menu 2', 'description': 'Menu description 2'}}
+    submenus = {SUBMENU_ID: {'title': 'Submenu 1', 'description': 'Submenu description 1', 'menu_id': MENU_ID},
+                OTHER_SUBMENU_ID: {'title': 'Submenu 2', 'description': 'Submenu description 2', 'menu_id': MENU_ID}}
+    dishes = {DISH_ID: {'title': 'Dish 1',
+                        'description': 'Dish description 1',
+                        'submenu_id': SUBMENU_ID,
+                        'price': Decimal('10.50')}}
+
+    return menus, submenus, dishes
+
+
+@pytest.mark.anyio
+async def test_compute_diff_unchanged():
+    diff = compute_diff(document(), document())
+
+    assert not diff
+    assert (diff.tags, diff.keys) == (set(), set())
+
+
+@pytest.mark.anyio
+async def test_compute_diff_row_edited():
+    menus, submenus, dishes = document()
+    dishes[DISH_ID] = {**dishes[DISH_ID], 'price': Decimal('12.00')}
+
+    diff = compute_diff((menus, submenus, dishes), document())
+
+    assert diff.upserts[Dish] == [{'id': uuid.UUID(DISH_ID), **dishes[DISH_ID], 'submenu_id': uuid.UUID(SUBMENU_ID)}]
+    assert not diff.upserts[Menu] and not diff.upserts[Submenu] and not any(diff.deletions.values())
+    assert {dish_key(MENU_ID, SUBMENU_ID, DISH_ID),
+            dish_list_key(MENU_ID, SUBMENU_ID),
+            submenu_key(MENU_ID, SUBMENU_ID),
+            menu_key(MENU_ID),
+            MENU_LIST_KEY} <= diff.keys
+
+
+@pytest.mark.anyio
+async def test_compute_diff_row_removed():
+    menus, submenus, dishes = document()
+    del dishes[DISH_ID]
+
+    diff = compute_diff((menus, submenus, dishes), document())
+
+    assert diff.deletions[Dish] == [uuid.UUID(DISH_ID)]
+    assert not any(diff.upserts.values())
+    assert {dish_key(MENU_ID, SUBMENU_ID, DISH_ID), dish_list_key(MENU_ID, SUBMENU_ID)} <= diff.keys
+
+
+@pytest.mark.anyio
+async def test_compute_diff_row_moved():
+    menus, submenus, dishes = document()
+    submenus[OTHER_SUBMENU_ID] = {**submenus[OTHER_SUBMENU_ID], 'menu_id': OTHER_MENU_ID}
+    dishes[DISH_ID] = {**dishes[DISH_ID], 'submenu_id': OTHER_SUBMENU_ID}
+
+    diff = compute_diff((menus, submenus, dishes), document())
+
+    assert [row['menu_id'] for row in diff.upserts[Submenu]] == [uuid.UUID(OTHER_MENU_ID)]
+    assert [row['submenu_id'] for row in diff.upserts[Dish]] == [uuid.UUID(OTHER_SUBMENU_ID)]
+    assert not any(diff.deletions.values())
+    # Both the old and the new parents lose their cached counts and listings
+    assert submenu_tag(MENU_ID, OTHER_SUBMENU_ID) in diff.tags
+    assert {submenu_list_key(MENU_ID),
+            submenu_list_key(OTHER_MENU_ID),
+            dish_list_key(MENU_ID, SUBMENU_ID),
+            dish_list_key(OTHER_MENU_ID, OTHER_SUBMENU_ID),
+            dish_key(MENU_ID, SUBMENU_ID, DISH_ID),
+            dish_key(OTHER_MENU_ID, OTHER_SUBMENU_ID, DISH_ID)} <= diff.keys
+
+
+@pytest.mark.anyio
+async def test_compute_diff_parent_removed():
+    menus, _, _ = document()
+    del menus[MENU_ID]
+
+    diff = compute_diff((menus, {}, {}), document())
+
+    assert {model: set(pks) for model, pks in diff.deletions.items()} == {
+        Menu: {uuid.UUID(MENU_ID)},
+        Submenu: {uuid.UUID(SUBMENU_ID), uuid.UUID(OTHER_SUBMENU_ID)},
+        Dish: {uuid.UUID(DISH_ID)},
+    }
+    assert not any(diff.upserts.values())
+    assert {menu_tag(MENU_ID), submenu_tag(MENU_ID, SUBMENU_ID)} <= diff.tags
+    assert {MENU_LIST_KEY, menu_key(MENU_ID)} <= diff.keys
+
+
+@pytest.mark.anyio
+async def test_discount_keys():
+    assert discount_keys(document(), {DISH_ID: '10'}, {DISH_ID: '10'}) == set()
+    keys = {dish_list_key(MENU_ID, SUBMENU_ID), dish_key(MENU_ID, SUBMENU_ID, DISH_ID)}
+    assert discount_keys(document(), {DISH_ID: '10'}, {DISH_ID: '20'}) == keys
+    assert discount_keys(document(), {}, {DISH_ID: '20'}) == keys
+
+
+@pytest.mark.anyio
+async def test_apply_diff():
+    await apply_diff(compute_diff(document(), ({}, {}, {})), async_session_test)
+    assert await collect_from_db(async_session_test) == document()
+
+    menus, submenus, dishes = document()
+    del menus[OTHER_MENU_ID]
+    submenus[OTHER_SUBMENU_ID] = {**submenus[OTHER_SUBMENU_ID], 'title': 'Updated submenu'}
+    dishes[DISH_ID] = {**dishes[DISH_ID], 'submenu_id': OTHER_SUBMENU_ID}
+
+    await apply_diff(compute_diff((menus, submenus, dishes), document()), async_session_test)
+    assert await collect_from_db(async_session_test) == (menus, submenus, dishes)
+
+
+@pytest.mark.anyio
+async def test_synchronize_if_changed_deletes_rows_of_evicted_state(tmp_path):
+    path = str(tmp_path / 'MenuSheets.xlsx')
+    rows = utils_test.workbook_rows(MENU_ID, SUBMENU_ID, DISH_ID)
+    await synchronize_if_changed(redis, utils_test.write_workbook(path, rows), async_session_test)
+    assert set((await collect_from_db(async_session_test))[2]) == {DISH_ID}
+
+    await redis.unlink(SYNC_ROWS_KEYS[2])  # Evicted under maxmemory
+    await synchronize_if_changed(redis, utils_test.write_workbook(path, rows[:2]), async_session_test)
+
+    assert (await collect_from_db(async_session_test))[2] == {}
+
+
+@pytest.mark.anyio
+async def test_synchronize_if_changed_refills_recreated_tables(tmp_path):
+    path = utils_test.write_workbook(str(tmp_path / 'MenuSheets.xlsx'),
+                                     utils_test.workbook_rows(MENU_ID, SUBMENU_ID, DISH_ID))
+    await synchronize_if_changed(redis, path, async_session_test)
+
+    # The tables are recreated while Redis keeps the state, and the workbook is saved again unchanged
+    async with engine_test.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    mtime = os.stat(path).st_mtime_ns + 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+    await synchronize_if_changed(redis, path, async_session_test)
+
+    menus, submenus, dishes = await collect_from_db(async_session_test)
+    assert (set(menus), set(submenus), set(dishes)) == ({MENU_ID}, {SUBMENU_ID}, {DISH_ID})
+
+
+@pytest.mark.anyio
+async def test_synchronize_if_changed_drops_dishes_with_changed_discount(tmp_path):
+    path = str(tmp_path / 'MenuSheets.xlsx')
+    rows = utils_test.workbook_rows(MENU_ID, SUBMENU_ID, DISH_ID, discount=10)
+    await synchronize_if_changed(redis, utils_test.write_workbook(path, rows), async_session_test)
+    await redis.set(dish_key(MENU_ID, SUBMENU_ID, DISH_ID), b'{}')
+
+    # The tables do not change, only the price sent for the dish does
+    rows = utils_test.workbook_rows(MENU_ID, SUBMENU_ID, DISH_ID, discount=20)
+    await synchronize_if_changed(redis, utils_test.write_workbook(path, rows), async_session_test)
+
+    assert not await redis.exists(dish_key(MENU_ID, SUBMENU_ID, DISH_ID))
+
+
+@pytest.mark.anyio
+async def test_synchronize_if_changed_restores_rows_deleted_through_api(ac: AsyncClient, tmp_path):
+    path = utils_test.write_workbook(str(tmp_path / 'MenuSheets.xlsx'),
+                                     utils_test.workbook_rows(MENU_ID, SUBMENU_ID, DISH_ID))
+    await synchronize_if_changed(redis, path, async_session_test)
+
+    response = await ac.delete(get_url_from_api_route_name(app, 'delete_menu', menu_id=MENU_ID))
+    assert response.status_code == 200
+
+    # The workbook has not changed, the write alone makes the next run compare it with the tables
+    await synchronize_if_changed(redis, path, async_session_test)
+
+    menus, submenus, dishes = await collect_from_db(async_session_test)
+    assert (set(menus), set(submenus), set(dishes)) == ({MENU_ID}, {SUBMENU_ID}, {DISH_ID})
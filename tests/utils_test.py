@@ -1,6 +1,7 @@
 from typing import Sequence
 from uuid import UUID
 
+import openpyxl
 from conftest import async_session_test
 from sqlalchemy import select
 
@@ -53,3 +54,19 @@ async def get_dishes() -> Sequence[Dish]:
         dishes = await session.execute(select(Dish))
 
         return dishes.scalars().all()
+
+
+def write_workbook(path: str, rows: list[tuple]) -> str:
+    book = openpyxl.Workbook()
+    for row in rows:
+        book.active.append(row)
+    book.save(path)
+
+    return str(path)
+
+
+def workbook_rows(menu_id: str, submenu_id: str, dish_id: str, discount: int | None = None) -> list[tuple]:
+    # The layout of admin/MenuSheets.xlsx: each row is indented by the level of its entity
+    return [(menu_id, 'Menu 1', 'Menu description 1'),
+            (None, submenu_id, 'Submenu 1', 'Submenu description 1'),
+            (None, None, dish_id, 'Dish 1', 'Dish description 1', 10.5, discount)]